@@ -0,0 +1,486 @@
+# api_server.py
+"""Headless HTTP/SSE API for the chat pipeline, for editors and scripts.
+
+Runs on asyncio with no web framework: each connection carries one request
+and is closed after the response. Chat turns stream tokens as server-sent
+events from the providers' async LangChain APIs. Sessions (chat history,
+history window, prompt prefix) live on the server, and their goal and code
+context in the shared ContextStore, keyed by session id.
+
+    python api_server.py --port 8765
+
+Endpoints:
+    GET    /health                       server and provider queue status
+    POST   /sessions                     {"llm_provider", "config", "stable_prompt_prefix", "goal"} -> {"session_id"}
+    GET    /sessions/<id>                session summary
+    DELETE /sessions/<id>
+    POST   /sessions/<id>/context        {"project_path", "files", "outline", "pinned", "goal"} builds the code context
+    POST   /sessions/<id>/chat           {"message"} -> text/event-stream of token, done and error events
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+import uuid
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+import yaml
+
+from file_manager import (get_folder_tree, get_selected_files_content, get_tree_file_paths,
+                          get_tree_structure_string)
+from context_writer import context_length, iter_context_sections
+from llm import LLMHandler
+from llm_chain import LLMChainWrapper
+from chat_history import ChatHistoryManager, resolve_history_budget
+from prompt_prefix import PromptPrefixState
+from context_snapshot import ContextSnapshot
+from context_store import DEFAULT_IDLE_SECONDS, DEFAULT_MAX_MEGABYTES, get_context_store
+from telemetry import TELEMETRY_PATH, get_telemetry_log
+from response_cache import MAX_MEGABYTES, TTL_HOURS, get_shared_response_cache
+
+LLM_PROVIDERS = ("OpenAI", "Azure OpenAI", "Ollama")
+# Concurrent chat streams per provider; override with `api_max_concurrency` in config.yaml.
+DEFAULT_CONCURRENCY = {"OpenAI": 16, "Azure OpenAI": 16, "Ollama": 2}
+DEFAULT_MAX_QUEUE = 32  # requests waiting for a provider slot before new ones get 429
+SESSION_IDLE_SECONDS = 60 * 60
+MAX_BODY_BYTES = 1024 * 1024
+READ_TIMEOUT_SECONDS = 30
+WRITE_BUFFER_HIGH = 64 * 1024
+
+# Provider and prompt settings a session takes from config.yaml and may override.
+CONFIG_KEYS = (
+    "openai_api_key", "azure_openai_api_key", "azure_openai_endpoint", "azure_openai_deployment_name_chat",
+    "azure_openai_api_version", "azure_openai_deployment_name_embedding", "ollama_base_url",
+    "ollama_model_name_chat", "ollama_model_name_embedding", "context_token_budget", "vector_top_k",
+    "history_token_budget", "response_cache_enabled", "fallback_llm_provider", "hedge_after_seconds",
+    "provider_retries", "retry_backoff_seconds",
+)
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers
+
+
+def load_config(path='config.yaml'):
+    """Reads config.yaml, returning {} if it does not exist."""
+    try:
+        with open(path, 'r') as f:
+            return yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        return {}
+
+
+def chunk_text(chunk):
+    """Text of a streamed chunk: a message chunk (chat models) or a plain string (Ollama)."""
+    content = getattr(chunk, "content", chunk)
+    return content if isinstance(content, str) else None
+
+
+class ProviderLimiter:
+    """Caps concurrent chat streams per provider.
+
+    Requests beyond the limit wait for a slot; once max_queue requests are
+    already waiting for a provider, new ones are rejected with 429 instead
+    of piling up behind it.
+    """
+
+    def __init__(self, limits=None, max_queue=DEFAULT_MAX_QUEUE):
+        self.limits = dict(DEFAULT_CONCURRENCY)
+        self.limits.update(limits or {})
+        self.max_queue = max_queue
+        self._semaphores = {}
+        self.active = {}
+        self.waiting = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, llm_provider):
+        semaphore = self._semaphores.get(llm_provider)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limits.get(llm_provider, 1))
+            self._semaphores[llm_provider] = semaphore
+        if semaphore.locked() and self.waiting.get(llm_provider, 0) >= self.max_queue:
+            raise HttpError(429, f"Too many queued requests for {llm_provider}", [("Retry-After", "1")])
+        self.waiting[llm_provider] = self.waiting.get(llm_provider, 0) + 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting[llm_provider] -= 1
+        self.active[llm_provider] = self.active.get(llm_provider, 0) + 1
+        try:
+            yield
+        finally:
+            self.active[llm_provider] -= 1
+            semaphore.release()
+
+    def stats(self):
+        return {
+            llm_provider: {"limit": limit, "active": self.active.get(llm_provider, 0), "waiting": self.waiting.get(llm_provider, 0)}
+            for llm_provider, limit in self.limits.items()
+        }
+
+
+class ApiSession:
+    """Server-side state of one chat: what app.py keeps in st.session_state."""
+
+    def __init__(self, session_id, llm_provider, llm_config, stable_prompt_prefix, llm_handler, telemetry_log, response_cache=None,
+                 provider_slot=None):
+        self.session_id = session_id
+        self.llm_provider = llm_provider
+        self.llm_config = llm_config
+        self.stable_prompt_prefix = stable_prompt_prefix
+        self.llm_chain_wrapper = LLMChainWrapper(llm_handler, telemetry_log, response_cache=response_cache, session_id=session_id,
+                                                 provider_slot=provider_slot)
+        self.chat_history = []
+        self.chat_initialized = False
+        self.history_manager = ChatHistoryManager(
+            llm_provider, resolve_history_budget(llm_provider, llm_config.get("history_token_budget")),
+            file_source=self.saved_file_texts
+        )
+        self.prefix_state = PromptPrefixState()
+        self.context_files = 0
+        self.context_snapshot = None
+        self.last_prompt_stats = None
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+    def saved_file_texts(self, paths):
+        """Current text of the given files in the saved context, for collapsed context updates."""
+        if self.context_snapshot is None:
+            return {}
+        return {path: self.context_snapshot.file_contents[path] for path in paths if path in self.context_snapshot.file_contents}
+
+    def save_goal(self, goal_text):
+        get_context_store().put(self.session_id, "goal", goal_text)
+
+    def build_context(self, project_path, files=None, outline=False, pinned=()):
+        """Stores this session's code context from project_path (all files, or the given relative paths).
+
+        With outline, Python files are outlined except the relative paths in pinned.
+        """
+        if not os.path.isdir(project_path):
+            raise HttpError(400, f"Not a directory: {project_path}")
+        tree_data = get_folder_tree(project_path)
+        if files is None:
+            selected = get_tree_file_paths(tree_data)
+        else:
+            selected = [os.path.join(project_path, path) for path in files]
+        pinned_files = [os.path.join(project_path, path) for path in pinned]
+        file_contents = get_selected_files_content(selected, project_path, outline, pinned_files)
+        tree_str = get_tree_structure_string(tree_data)
+        get_context_store().put(self.session_id, "code", iter_context_sections(tree_str, file_contents))
+        self.context_snapshot = ContextSnapshot(project_path, selected, tree_str, file_contents, outline, pinned_files)
+        self.llm_config["project_path"] = project_path
+        self.context_files = len(file_contents)
+        self.chat_initialized = False
+        self.prefix_state = PromptPrefixState()
+        result = {"files": len(file_contents), "chars": context_length(tree_str, file_contents)}
+        if self.llm_config.get("vectorization_enabled"):
+            result["vector_index"] = self.llm_chain_wrapper.build_vector_index(file_contents, self.llm_provider, self.llm_config)
+        return result
+
+    def refresh_context(self):
+        """Updates the stored code context for files edited since the last turn; mid-chat, adds their diffs to the history."""
+        if self.context_snapshot is None:
+            return
+        update = self.context_snapshot.refresh()
+        if update is None:
+            return
+        get_context_store().put(self.session_id, "code",
+                                iter_context_sections(self.context_snapshot.tree_str, self.context_snapshot.file_contents))
+        if self.chat_initialized:
+            self.chat_history.append({"role": "user", "content": update.text, "kind": "context_update",
+                                      "paths": update.changed + update.deleted})
+
+    def start_turn(self, user_message):
+        """Builds the prompt for user_message and returns the provider's async token stream."""
+        self.refresh_context()
+        if self.stable_prompt_prefix:
+            stream = self.llm_chain_wrapper.get_stable_prefix_llm_response(
+                user_message, self.llm_provider, self.llm_config, self.chat_history,
+                self.prefix_state, self.history_manager, asynchronous=True
+            )
+        elif not self.chat_initialized:
+            stream = self.llm_chain_wrapper.get_initial_llm_response(
+                user_message, self.llm_provider, self.llm_config, asynchronous=True
+            )
+        else:
+            stream = self.llm_chain_wrapper.get_followup_llm_response(
+                user_message, self.llm_provider, self.llm_config, self.chat_history,
+                self.history_manager, asynchronous=True
+            )
+            self.last_prompt_stats = None
+            return stream
+        self.last_prompt_stats = self.llm_chain_wrapper.last_prompt_stats
+        return stream
+
+    def summary(self):
+        return {
+            "session_id": self.session_id,
+            "llm_provider": self.llm_provider,
+            "stable_prompt_prefix": self.stable_prompt_prefix,
+            "messages": len(self.chat_history),
+            "context_files": self.context_files,
+            "busy": self.lock.locked(),
+        }
+
+
+class SessionStore:
+    """Sessions by id; idle ones are dropped together with their stored context."""
+
+    def __init__(self, idle_seconds=SESSION_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._sessions = {}
+
+    def add(self, session):
+        self._sessions[session.session_id] = session
+
+    def get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise HttpError(404, f"Unknown session {session_id}")
+        session.last_used = time.monotonic()
+        return session
+
+    def remove(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            raise HttpError(404, f"Unknown session {session_id}")
+        get_context_store().remove(session_id)
+
+    def evict_idle(self):
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if not session.lock.locked() and now - session.last_used > self.idle_seconds:
+                self.remove(session_id)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+def _head(status, content_type, extra_headers=(), content_length=None):
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Type: {content_type}", "Connection: close"]
+    if content_length is not None:
+        lines.append(f"Content-Length: {content_length}")
+    lines.extend(f"{name}: {value}" for name, value in extra_headers)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode('utf-8')
+
+
+async def read_request(reader):
+    """Parses one HTTP/1.1 request; returns (method, path, body) or None if the client sent nothing."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), urlsplit(target).path, body
+
+
+def _json_body(body):
+    if not body:
+        return {}
+    try:
+        payload = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        raise HttpError(400, "Request body must be JSON")
+    if not isinstance(payload, dict):
+        raise HttpError(400, "Request body must be a JSON object")
+    return payload
+
+
+class ApiServer:
+    def __init__(self, config, llm_handler=None):
+        self.config = config
+        self.llm_handler = llm_handler or LLMHandler()
+        self.telemetry_log = get_telemetry_log(config.get('telemetry_log_path', TELEMETRY_PATH))
+        get_context_store(
+            max_megabytes=config.get('context_store_max_mb', DEFAULT_MAX_MEGABYTES),
+            idle_seconds=config.get('context_store_idle_minutes', DEFAULT_IDLE_SECONDS // 60) * 60,
+            spill=config.get('context_store_spill', True),
+        )
+        self.response_cache = get_shared_response_cache(
+            ttl_hours=config.get('response_cache_ttl_hours', TTL_HOURS),
+            max_megabytes=config.get('response_cache_max_mb', MAX_MEGABYTES),
+        )
+        self.limiter = ProviderLimiter(config.get('api_max_concurrency'), config.get('api_max_queue', DEFAULT_MAX_QUEUE))
+        self.sessions = SessionStore(config.get('api_session_idle_seconds', SESSION_IDLE_SECONDS))
+
+    async def handle_connection(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH)
+        try:
+            request = await asyncio.wait_for(read_request(reader), READ_TIMEOUT_SECONDS)
+            if request is not None:
+                await self.dispatch(*request, writer)
+        except HttpError as e:
+            await self.send_json(writer, e.status, {"error": e.message}, e.headers)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            await self.send_json(writer, 500, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            with contextlib.suppress(Exception):
+                writer.close()
+                await writer.wait_closed()
+
+    async def send_json(self, writer, status, payload, extra_headers=()):
+        data = json.dumps(payload).encode('utf-8')
+        with contextlib.suppress(ConnectionError):
+            writer.write(_head(status, "application/json", extra_headers, len(data)) + data)
+            await writer.drain()
+
+    async def dispatch(self, method, path, body, writer):
+        parts = [part for part in path.split('/') if part]
+        if parts == ["health"] and method == "GET":
+            return await self.send_json(writer, 200, {"status": "ok", "sessions": len(self.sessions), "providers": self.limiter.stats()})
+        if parts == ["sessions"] and method == "POST":
+            return await self.create_session(_json_body(body), writer)
+        if len(parts) >= 2 and parts[0] == "sessions":
+            session = self.sessions.get(parts[1])
+            if len(parts) == 2 and method == "GET":
+                return await self.send_json(writer, 200, session.summary())
+            if len(parts) == 2 and method == "DELETE":
+                if session.lock.locked():
+                    raise HttpError(409, "A turn is running for this session")
+                self.sessions.remove(session.session_id)
+                return await self.send_json(writer, 200, {"deleted": session.session_id})
+            if parts[2:] == ["context"] and method == "POST":
+                return await self.build_context(session, _json_body(body), writer)
+            if parts[2:] == ["chat"] and method == "POST":
+                return await self.chat(session, _json_body(body), writer)
+        raise HttpError(404, f"No route for {method} {path}")
+
+    async def create_session(self, payload, writer):
+        llm_provider = payload.get("llm_provider") or self.config.get('default_llm_provider', 'OpenAI')
+        if llm_provider not in LLM_PROVIDERS:
+            raise HttpError(400, f"llm_provider must be one of {', '.join(LLM_PROVIDERS)}")
+        llm_config = {key: self.config.get(key) for key in CONFIG_KEYS}
+        llm_config["vectorization_enabled"] = self.config.get('default_vectorization', False)
+        llm_config["response_cache_enabled"] = self.config.get('response_cache_enabled', False)
+        overrides = payload.get("config") or {}
+        llm_config.update({key: value for key, value in overrides.items() if key in CONFIG_KEYS or key == "vectorization_enabled"})
+        session = ApiSession(
+            uuid.uuid4().hex, llm_provider, llm_config,
+            payload.get("stable_prompt_prefix", self.config.get('stable_prompt_prefix', False)),
+            self.llm_handler, self.telemetry_log, self.response_cache, self.limiter.slot,
+        )
+        if payload.get("goal") is not None:
+            await asyncio.to_thread(session.save_goal, payload["goal"])
+        self.sessions.add(session)
+        await self.send_json(writer, 201, session.summary())
+
+    async def build_context(self, session, payload, writer):
+        if not payload.get("project_path"):
+            raise HttpError(400, "project_path is required")
+        if session.lock.locked():
+            raise HttpError(409, "A turn is running for this session")
+        async with session.lock:
+            if payload.get("goal") is not None:
+                await asyncio.to_thread(session.save_goal, payload["goal"])
+            result = await asyncio.to_thread(
+                session.build_context, payload["project_path"], payload.get("files"),
+                bool(payload.get("outline")), payload.get("pinned") or (),
+            )
+        await self.send_json(writer, 200, result)
+
+    async def chat(self, session, payload, writer):
+        """Runs one chat turn, streaming tokens to the client as server-sent events.
+
+        Prompt construction runs in a worker thread; the provider stream is
+        consumed on the event loop and every event is drained to the socket
+        before the next chunk is read, so a slow client slows its own stream
+        rather than buffering the response in memory.
+        """
+        user_message = payload.get("message")
+        if not isinstance(user_message, str) or not user_message.strip():
+            raise HttpError(400, "message is required")
+        if session.lock.locked():
+            raise HttpError(409, "A turn is already running for this session")
+        async with session.lock:
+            async with self.limiter.slot(session.llm_provider):
+                stream = await asyncio.to_thread(session.start_turn, user_message)
+                if isinstance(stream, str):
+                    raise HttpError(400, stream)
+                writer.write(_head(200, "text/event-stream", [("Cache-Control", "no-cache")]))
+                parts = []
+                try:
+                    async for chunk in stream:
+                        content = chunk_text(chunk)
+                        if content:
+                            parts.append(content)
+                            writer.write(_sse("token", {"text": content}))
+                            await writer.drain()
+                except ConnectionError:
+                    return
+                except Exception as e:
+                    with contextlib.suppress(ConnectionError):
+                        writer.write(_sse("error", {"message": f"Error generating response: {e}"}))
+                        await writer.drain()
+                    return
+                finally:
+                    with contextlib.suppress(Exception):
+                        await stream.aclose()
+                full_response = "".join(parts)
+                session.chat_history.append({"role": "user", "content": user_message})
+                session.chat_history.append({"role": "assistant", "content": full_response})
+                session.chat_initialized = True
+                session.last_used = time.monotonic()
+                with contextlib.suppress(ConnectionError):
+                    writer.write(_sse("done", {"response_chars": len(full_response), "prompt_stats": session.last_prompt_stats}))
+                    await writer.drain()
+
+    async def evict_idle_sessions(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            self.sessions.evict_idle()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        eviction = asyncio.create_task(self.evict_idle_sessions())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            eviction.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/SSE API for the code assistant.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--config", default="config.yaml")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    server = ApiServer(load_config(args.config))
+    print(f"Serving on http://{args.host}:{args.port}")
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
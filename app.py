@@ -1,14 +1,46 @@
 # app.py
 import streamlit as st
+import logging
 import os
+import uuid
 from streamlit_tree_select import tree_select
 import yaml
 from file_manager import (FILE_IGNORE, FOLDER_IGNORE, get_folder_tree,
                             should_ignore, get_selected_files_content,
-                            get_tree_structure_string, format_output_text,
-                            save_context_file, save_goal_file, read_goal_file)
+                            get_tree_structure_string, format_output_preview,
+                            iter_context_sections, save_context_file,
+                            save_goal_file, read_goal_file)
 from llm import LLMHandler
+from ollama_models import format_model_label
 from llm_chain import LLMChainWrapper
+from chat_history import ChatHistoryManager, resolve_history_budget
+from prompt_prefix import PromptPrefixState
+from stream_renderer import StreamRenderer, format_stream_stats
+from context_snapshot import ContextSnapshot
+from context_store import DEFAULT_IDLE_SECONDS, DEFAULT_MAX_MEGABYTES, get_context_store
+from telemetry import TELEMETRY_PATH, get_telemetry_log
+from session_log import CHAT_LOG_DIR, get_session_log, is_session_id
+from response_cache import MAX_MEGABYTES, TTL_HOURS, get_shared_response_cache
+
+NOTICE_LOGGERS = ('file_manager', 'llm', 'llm_chain')
+
+class StreamlitNoticeHandler(logging.Handler):
+    """Shows warnings and errors logged by the non-UI modules on the page"""
+    def emit(self, record):
+        if record.levelno >= logging.ERROR:
+            st.error(record.getMessage())
+        else:
+            st.warning(record.getMessage())
+
+def install_notice_handler():
+    """Routes module warnings to the page; app.py reruns, so the handler is added only once per logger"""
+    for name in NOTICE_LOGGERS:
+        logger = logging.getLogger(name)
+        if not any(handler.get_name() == 'streamlit_notices' for handler in logger.handlers):
+            handler = StreamlitNoticeHandler(logging.WARNING)
+            handler.set_name('streamlit_notices')
+            logger.addHandler(handler)
+            logger.propagate = False
 
 def setup_page_config():
     """Configure page settings and custom CSS"""
@@ -45,8 +77,29 @@ def load_configuration():
         st.error(f"Error parsing config.yaml: {e}")
     return config
 
+CHAT_RENDER_MESSAGES = 50  # messages shown before "Show earlier messages"
+
+PROVIDER_SETTING_KEYS = (
+    'openai_api_key', 'azure_openai_api_key', 'azure_openai_endpoint', 'azure_openai_deployment_name_chat',
+    'azure_openai_api_version', 'azure_openai_deployment_name_embedding', 'ollama_base_url',
+    'ollama_model_name_chat', 'ollama_model_name_embedding',
+)
+
 def initialize_session_state(config):
     """Initialize all session state variables"""
+    if 'session_id' not in st.session_state:
+        # Keys this browser session's goal, code context, vector index and chat log. The id is kept
+        # in the URL, so reloading the page (even after a restart) resumes the session's chat.
+        session_id = st.query_params.get("session")
+        if not is_session_id(session_id):
+            session_id = uuid.uuid4().hex
+            st.query_params["session"] = session_id
+        st.session_state['session_id'] = session_id
+        default_goal = read_goal_file()
+        if default_goal and get_context_store().get(session_id, "goal") is None:
+            save_goal_file(default_goal, session_id)
+    if 'chat_log' not in st.session_state:
+        st.session_state['chat_log'] = get_session_log(st.session_state['session_id'], config.get('chat_log_dir', CHAT_LOG_DIR))
     if 'selected_files' not in st.session_state:
         st.session_state['selected_files'] = None
     if 'goal_defined' not in st.session_state:
@@ -57,14 +110,53 @@ def initialize_session_state(config):
         st.session_state['llm_provider'] = config.get('default_llm_provider', 'OpenAI')
     if 'vectorization_enabled' not in st.session_state:
         st.session_state['vectorization_enabled'] = config.get('default_vectorization', False)
+    if 'context_mode' not in st.session_state:
+        st.session_state['context_mode'] = "Outline" if config.get('default_context_mode') == "outline" else "Full files"
+    if 'response_cache_enabled' not in st.session_state:
+        st.session_state['response_cache_enabled'] = config.get('response_cache_enabled', False)
     if 'copy_prompt_requested' not in st.session_state:
         st.session_state['copy_prompt_requested'] = False
     if 'chat_history' not in st.session_state:
-        st.session_state['chat_history'] = []
+        # None until needed: a resumed session only reads the messages it displays.
+        st.session_state['chat_history'] = [] if not st.session_state['chat_log'] else None
     if 'chat_initialized' not in st.session_state:
-        st.session_state['chat_initialized'] = False
+        # A resumed chat continues only if its code context is still in the store; after a
+        # restart or an idle expiry it is gone, and the user is asked to save it again.
+        resumed = bool(st.session_state['chat_log'])
+        st.session_state['chat_initialized'] = resumed and has_saved_context()
+        st.session_state['context_missing'] = resumed and not st.session_state['chat_initialized']
+    if 'chat_render_count' not in st.session_state:
+        st.session_state['chat_render_count'] = config.get('chat_render_messages', CHAT_RENDER_MESSAGES)
+        st.session_state['chat_render_page'] = st.session_state['chat_render_count']
     if 'show_context' not in st.session_state:
         st.session_state['show_context'] = True
+    if 'context_token_budget' not in st.session_state:
+        st.session_state['context_token_budget'] = config.get('context_token_budget', {})
+    if 'last_prompt_stats' not in st.session_state:
+        st.session_state['last_prompt_stats'] = None
+    if 'vector_top_k' not in st.session_state:
+        st.session_state['vector_top_k'] = config.get('vector_top_k', 8)
+    if 'history_token_budget' not in st.session_state:
+        st.session_state['history_token_budget'] = config.get('history_token_budget', {})
+    if 'history_manager' not in st.session_state:
+        st.session_state['history_manager'] = None
+    if 'stable_prompt_prefix' not in st.session_state:
+        st.session_state['stable_prompt_prefix'] = config.get('stable_prompt_prefix', False)
+    if 'prefix_state' not in st.session_state:
+        st.session_state['prefix_state'] = None
+    if 'last_stream_stats' not in st.session_state:
+        st.session_state['last_stream_stats'] = None
+    if 'context_snapshot' not in st.session_state:
+        st.session_state['context_snapshot'] = None
+    if 'fallback_llm_provider' not in st.session_state:
+        st.session_state['fallback_llm_provider'] = config.get('fallback_llm_provider')
+    for key in ('hedge_after_seconds', 'provider_retries', 'retry_backoff_seconds'):
+        if key not in st.session_state:
+            st.session_state[key] = config.get(key)
+    # The fallback provider is not configured in the sidebar, so its settings come from config.yaml.
+    for key in PROVIDER_SETTING_KEYS:
+        if key not in st.session_state:
+            st.session_state[key] = config.get(key)
 
 def configure_llm_provider_settings(config):
     """Configure LLM provider selection and corresponding settings"""
@@ -72,6 +164,13 @@ def configure_llm_provider_settings(config):
     llm_provider_options = ["OpenAI", "Azure OpenAI", "Ollama"]
     llm_provider = st.selectbox("Select", llm_provider_options, index=llm_provider_options.index(st.session_state['llm_provider']))
     st.session_state['llm_provider'] = llm_provider
+    st.session_state['stable_prompt_prefix'] = st.checkbox("Stable Prompt Prefix", value=st.session_state['stable_prompt_prefix'], help="Send the system prompt, goal and code context as the same leading messages on every turn, with history as real chat messages, so provider prompt caching can reuse them.")
+    st.session_state['vectorization_enabled'] = st.checkbox("Enable Vectorization", value=st.session_state['vectorization_enabled'], help="Index the saved context with the provider's embedding model and send only the code chunks most relevant to each message.")
+    fallback_options = ["None"] + [option for option in llm_provider_options if option != llm_provider]
+    fallback = st.session_state['fallback_llm_provider'] if st.session_state['fallback_llm_provider'] in fallback_options else "None"
+    fallback = st.selectbox("Fallback Provider", fallback_options, index=fallback_options.index(fallback), help="Retry on this provider when the selected one fails, or race it when no first token arrives within hedge_after_seconds (config.yaml). Its settings are read from config.yaml.")
+    st.session_state['fallback_llm_provider'] = None if fallback == "None" else fallback
+    st.session_state['response_cache_enabled'] = st.checkbox("Cache Responses", value=st.session_state['response_cache_enabled'], help="Replay the saved answer when exactly the same messages are sent to the same model again, instead of calling the provider.")
 
     if llm_provider == "OpenAI":
         st.session_state['openai_api_key'] = st.text_input("OpenAI API Key", type="password", value=config.get('openai_api_key', ""), help="Enter your OpenAI API key. You can save it in config.yaml for default use.")
@@ -85,10 +184,19 @@ def configure_llm_provider_settings(config):
         st.session_state['ollama_base_url'] = st.text_input("Ollama Base URL", value=config.get('ollama_base_url', "http://localhost:11434"), help="Enter your Ollama Base URL (default is http://localhost:11434).")
         
         if st.session_state['ollama_base_url']:
-            available_models = llm_handler.list_ollama_models(st.session_state['ollama_base_url'])
+            discovery = llm_handler.ollama_models(st.session_state['ollama_base_url'])
+            models = {model["name"]: model for model in discovery["models"]}
+            available_models = list(models)
             if available_models:
-                st.session_state['ollama_model_name_chat'] = st.selectbox("Ollama Chat Model", options=available_models, index=0, help="Select Ollama model for chat.")
-                st.session_state['ollama_model_name_embedding'] = st.selectbox("Ollama Embedding Model", options=available_models, index=0, help="Select Ollama model for embeddings.")
+                label = lambda name: format_model_label(models[name])
+                st.session_state['ollama_model_name_chat'] = st.selectbox("Ollama Chat Model", options=available_models, index=0, format_func=label, help="Select Ollama model for chat.")
+                st.session_state['ollama_model_name_embedding'] = st.selectbox("Ollama Embedding Model", options=available_models, index=0, format_func=label, help="Select Ollama model for embeddings.")
+                if discovery["error"]:
+                    st.caption(f"Ollama unreachable ({discovery['error']}); showing the model list from {discovery['age']:.0f}s ago.")
+                elif discovery["refreshing"]:
+                    st.caption("Refreshing the model list in the background.")
+            elif discovery["error"]:
+                st.error(f"Error fetching Ollama models: {discovery['error']}")
             else:
                 st.error("No Ollama models found. Please ensure Ollama is running and models are installed.")
         else:
@@ -106,7 +214,9 @@ def setup_code_context():
 
         if folder_path_input:
             if os.path.isdir(folder_path_input):
-                tree_data = get_folder_tree(folder_path_input)
+                scan_stats = {}
+                tree_data = get_folder_tree(folder_path_input, scan_stats)
+                st.caption(f"Tree scan: {scan_stats['hits']} cached dirs, {scan_stats['misses']} rescanned, {scan_stats['pruned']} entries ignored")
                 selected = tree_select(tree_data, key="tree_sidebar_right")
                 if selected:
                     selected_files_folders = selected.get("checked") or []
@@ -116,23 +226,76 @@ def setup_code_context():
                     ]
 
                 if selected_files:
-                    st.session_state['file_contents'] = get_selected_files_content(selected_files, folder_path_input)
+                    st.session_state['context_mode'] = st.radio("Context Mode", ["Full files", "Outline"], index=["Full files", "Outline"].index(st.session_state['context_mode']), horizontal=True, help="Outline sends only imports, signatures and docstrings of Python files, except the pinned ones.")
+                    pinned_files = []
+                    if st.session_state['context_mode'] == "Outline":
+                        pinned_files = st.multiselect("Pinned files (full content)", selected_files, format_func=lambda path: os.path.relpath(path, folder_path_input))
+                    st.session_state['file_contents'] = get_selected_files_content(
+                        selected_files, folder_path_input,
+                        outline=st.session_state['context_mode'] == "Outline", pinned_files=pinned_files
+                    )
                     tree_structure_str = get_tree_structure_string(tree_data)
-                    output_text = format_output_text(tree_structure_str, st.session_state['file_contents'])
-                    st.text_area("Context Preview", output_text, height=300)
+                    preview_text, total_chars = format_output_preview(tree_structure_str, st.session_state['file_contents'])
+                    st.text_area("Context Preview", preview_text, height=300)
+                    if total_chars > len(preview_text):
+                        st.caption(f"Showing the first {len(preview_text):,} of {total_chars:,} characters.")
                     if st.button("Save Context", key="save_context_button_right"):
-                        if save_context_file(output_text):
-                            st.success("Context saved to context/code.txt")
+                        if save_context_file(iter_context_sections(tree_structure_str, st.session_state['file_contents']), st.session_state['session_id']):
+                            st.success("Context saved for this session")
                             st.session_state['chat_initialized'] = False
+                            st.session_state['context_missing'] = False
+                            st.session_state['context_snapshot'] = ContextSnapshot(
+                                folder_path_input, selected_files, tree_structure_str, st.session_state['file_contents'],
+                                st.session_state['context_mode'] == "Outline", pinned_files
+                            )
+                            if st.session_state['vectorization_enabled']:
+                                build_vector_index(st.session_state['file_contents'])
                 else:
                     st.info("No files selected or no valid folder path provided.")
 
+def get_llm_config():
+    """Collects provider settings from session state for LLMChainWrapper calls"""
+    return {
+        "openai_api_key": st.session_state.get('openai_api_key'),
+        "azure_openai_api_key": st.session_state.get('azure_openai_api_key'),
+        "azure_openai_endpoint": st.session_state.get('azure_openai_endpoint'),
+        "azure_openai_deployment_name_chat": st.session_state.get('azure_openai_deployment_name_chat'),
+        "azure_openai_api_version": st.session_state.get('azure_openai_api_version'),
+        "azure_openai_deployment_name_embedding": st.session_state.get('azure_openai_deployment_name_embedding'),
+        "ollama_base_url": st.session_state.get('ollama_base_url'),
+        "ollama_model_name_chat": st.session_state.get('ollama_model_name_chat'),
+        "ollama_model_name_embedding": st.session_state.get('ollama_model_name_embedding'),
+        "context_token_budget": st.session_state.get('context_token_budget'),
+        "project_path": st.session_state.get('folder_path_sidebar_right'),
+        "vectorization_enabled": st.session_state.get('vectorization_enabled'),
+        "response_cache_enabled": st.session_state.get('response_cache_enabled'),
+        "vector_top_k": st.session_state.get('vector_top_k'),
+        "history_token_budget": st.session_state.get('history_token_budget'),
+        "fallback_llm_provider": st.session_state.get('fallback_llm_provider'),
+        "hedge_after_seconds": st.session_state.get('hedge_after_seconds'),
+        "provider_retries": st.session_state.get('provider_retries'),
+        "retry_backoff_seconds": st.session_state.get('retry_backoff_seconds')
+    }
+
+def build_vector_index(file_contents):
+    """Embeds the selected files into the vector index used when vectorization is enabled"""
+    try:
+        with st.spinner("Embedding selected files..."):
+            build_stats = llm_chain_wrapper.build_vector_index(file_contents, st.session_state['llm_provider'], get_llm_config())
+        st.success(
+            f"Vector index built with {build_stats['chunks']} chunks "
+            f"({build_stats['hit_rate']:.0%} cached, {build_stats['embedding_calls']} embedding calls, "
+            f"{build_stats['embedding_calls_saved']} saved)"
+        )
+    except Exception as e:
+        st.error(f"Error building vector index: {e}")
+
 def handle_project_goal():
     """Handle project goal section"""
-    initial_goal = read_goal_file()
+    initial_goal = read_goal_file(st.session_state['session_id'])
     goal_text = st.text_area("Set Project Goal:", initial_goal, height=100)
     if st.button("Update Goal", key="update_goal_main"):
-        if save_goal_file(goal_text):
+        if save_goal_file(goal_text, st.session_state['session_id']):
             st.success("Goal updated and saved!")
         else:
             st.error("Failed to save goal.")
@@ -145,20 +308,25 @@ def handle_chat(llm_handler, llm_chain_wrapper):
         st.subheader("Chat with AI Assistant")
     with button_col:
         if st.button("Clear Chat"):
+            st.session_state['chat_log'].clear()
             st.session_state['chat_history'] = []
+            st.session_state['chat_render_count'] = st.session_state['chat_render_page']
+            st.session_state['history_manager'] = None
+            st.session_state['prefix_state'] = None
             st.session_state['chat_initialized'] = False
+            st.session_state['context_missing'] = False
             # Remove experimental_rerun() so the UI updates on the next interaction
 
+    check_saved_context()
     user_input = st.chat_input("Enter your message here", key="chat_input_main")
     
-    # Display chat history
-    for message in st.session_state['chat_history']:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    show_chat_history()
 
     if user_input:
+        refresh_saved_context()
+
         # Add and display user message
-        st.session_state['chat_history'].append({"role": "user", "content": user_input})
+        append_chat_message({"role": "user", "content": user_input})
         with st.chat_message("user"):
             st.markdown(user_input)
 
@@ -166,35 +334,44 @@ def handle_chat(llm_handler, llm_chain_wrapper):
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             full_response = ""
+            renderer = StreamRenderer(message_placeholder)
 
-            llm_config = {
-                "openai_api_key": st.session_state.get('openai_api_key'),
-                "azure_openai_api_key": st.session_state.get('azure_openai_api_key'),
-                "azure_openai_endpoint": st.session_state.get('azure_openai_endpoint'),
-                "azure_openai_deployment_name_chat": st.session_state.get('azure_openai_deployment_name_chat'),
-                "azure_openai_api_version": st.session_state.get('azure_openai_api_version'),
-                "ollama_base_url": st.session_state.get('ollama_base_url'),
-                "ollama_model_name_chat": st.session_state.get('ollama_model_name_chat')
-            }
+            llm_config = get_llm_config()
 
+            is_initial_turn = not st.session_state['chat_initialized']
+            stable_prefix = st.session_state['stable_prompt_prefix']
             try:
-                if not st.session_state['chat_initialized']:
+                if stable_prefix:
+                    if is_initial_turn or st.session_state['prefix_state'] is None:
+                        st.session_state['prefix_state'] = PromptPrefixState()
+                    response_generator = llm_chain_wrapper.get_stable_prefix_llm_response(
+                        user_input, st.session_state['llm_provider'], llm_config, get_chat_history()[:-1],
+                        st.session_state['prefix_state'], get_history_manager(llm_config)
+                    )
+                    st.session_state['chat_initialized'] = True
+                    st.session_state['last_prompt_stats'] = llm_chain_wrapper.last_prompt_stats
+                elif is_initial_turn:
                     response_generator = llm_chain_wrapper.get_initial_llm_response(
                         user_input, st.session_state['llm_provider'], llm_config
                     )
                     st.session_state['chat_initialized'] = True
+                    st.session_state['last_prompt_stats'] = llm_chain_wrapper.last_prompt_stats
                 else:
                     response_generator = llm_chain_wrapper.get_followup_llm_response(
-                        user_input, st.session_state['llm_provider'], llm_config, st.session_state['chat_history'][:-1]
+                        user_input, st.session_state['llm_provider'], llm_config, get_chat_history()[:-1],
+                        get_history_manager(llm_config)
                     )
     
                 for chunk in response_generator:
-                    chunk_content = extract_chunk_content(chunk)
-                    if chunk_content:
-                        full_response += chunk_content
-                        message_placeholder.markdown(full_response + "▌")
+                    renderer.add(extract_chunk_content(chunk))
     
-                message_placeholder.markdown(full_response)
+                full_response = renderer.finish()
+                st.session_state['last_stream_stats'] = renderer.stats
+                if is_initial_turn or stable_prefix:
+                    show_prompt_stats(st.session_state['last_prompt_stats'])
+                stream_summary = format_stream_stats(renderer.stats)
+                if stream_summary:
+                    st.caption(stream_summary)
     
             except Exception as e:
                 error_message = f"Error generating response: {str(e)}"
@@ -202,7 +379,137 @@ def handle_chat(llm_handler, llm_chain_wrapper):
                 full_response = error_message
     
             if full_response:
-                st.session_state['chat_history'].append({"role": "assistant", "content": full_response})
+                append_chat_message({"role": "assistant", "content": full_response})
+
+def has_saved_context():
+    """True if this session's code context is in the context store"""
+    return get_context_store().get(st.session_state['session_id'], "code") is not None
+
+def check_saved_context():
+    """Warns when the chat's saved code context is gone, instead of continuing without it"""
+    if st.session_state['chat_initialized'] and st.session_state['context_snapshot'] is not None and not has_saved_context():
+        # Expired while the session was idle: the next message starts over with a full context turn.
+        st.session_state['chat_initialized'] = False
+        st.session_state['prefix_state'] = None
+        st.session_state['context_snapshot'] = None
+        st.session_state['context_missing'] = True
+    if st.session_state.get('context_missing'):
+        st.warning("The code context of this chat is no longer saved (the app restarted or the session was idle). Save the context again; the next message starts a new conversation with the model, while the chat stays on screen.")
+
+def show_chat_history():
+    """Renders the last messages of the chat; older ones are read from the session log on request"""
+    total = len(st.session_state['chat_log'])
+    hidden = max(0, total - st.session_state['chat_render_count'])
+    if hidden and st.button(f"Show earlier messages ({hidden} hidden)"):
+        st.session_state['chat_render_count'] += st.session_state['chat_render_page']
+        hidden = max(0, total - st.session_state['chat_render_count'])
+    if st.session_state['chat_history'] is not None:
+        messages = st.session_state['chat_history'][hidden:]
+    else:
+        messages = st.session_state['chat_log'].read(hidden)
+    for message in messages:
+        with st.chat_message(message["role"]):
+            if message.get("kind") == "context_update":
+                with st.expander("Context update"):
+                    st.code(message["content"], language="diff")
+            else:
+                st.markdown(message["content"])
+
+def get_chat_history():
+    """Returns the full chat history, reading it from the session log the first time after a resume"""
+    if st.session_state['chat_history'] is None:
+        st.session_state['chat_history'] = st.session_state['chat_log'].read()
+    return st.session_state['chat_history']
+
+def append_chat_message(message):
+    """Adds a message to the session log and, once loaded, the in-memory history"""
+    st.session_state['chat_log'].append(message)
+    if st.session_state['chat_history'] is not None:
+        st.session_state['chat_history'].append(message)
+
+def refresh_saved_context():
+    """Brings the saved context up to date with files edited since it was shared.
+
+    The saved code context is rewritten so the next full context load is current.
+    Mid-conversation, the changes are also added to the chat history as
+    unified diffs, so the model sees them without the whole context being resent.
+    """
+    snapshot = st.session_state['context_snapshot']
+    if snapshot is None:
+        return
+    update = snapshot.refresh()
+    if update is None:
+        return
+    save_context_file(iter_context_sections(snapshot.tree_str, snapshot.file_contents), st.session_state['session_id'])
+    if not st.session_state['chat_initialized']:
+        return
+    append_chat_message({"role": "user", "content": update.text, "kind": "context_update", "paths": update.changed + update.deleted})
+    with st.chat_message("user"):
+        with st.expander("Context update"):
+            st.code(update.text, language="diff")
+    summary = f"{len(update.changed)} changed file(s) sent as {update.diff_chars:,} characters of diffs instead of {update.full_chars:,}"
+    if update.deleted:
+        summary += f", {len(update.deleted)} deleted"
+    st.caption(summary)
+
+def show_prompt_stats(prompt_stats):
+    """Shows how many tokens were sent, and with the stable prefix how many repeated the previous turn."""
+    if not prompt_stats:
+        return
+    approx = "" if prompt_stats["exact_tokens"] else "~"
+    summary = f"Prompt: {approx}{prompt_stats['prompt_tokens']:,} tokens (budget {prompt_stats['budget']:,})"
+    if prompt_stats["files_total"]:
+        summary += f" · {prompt_stats['files_included']}/{prompt_stats['files_total']} files in full"
+        if prompt_stats["files_truncated"]:
+            summary += f", {prompt_stats['files_truncated']} truncated"
+        if prompt_stats["files_omitted"]:
+            summary += f", {len(prompt_stats['files_omitted'])} omitted"
+    if "prefix_tokens_reused" in prompt_stats:
+        summary += f" · {approx}{prompt_stats['prefix_tokens_reused']:,} prefix tokens reused"
+    st.caption(summary)
+
+def show_performance_summary(telemetry_log):
+    """Shows p50/p95 request latency per provider and model from the telemetry log"""
+    rows = telemetry_log.summary()
+    if not rows:
+        return
+    def ms(seconds):
+        return "-" if seconds is None else f"{seconds * 1000:,.0f}"
+    with st.expander("Performance"):
+        st.table([
+            {
+                "Provider": row["provider"],
+                "Model": row["model"],
+                "Requests": row["requests"],
+                "Errors": row["errors"],
+                "Cache hits": row["cache_hits"],
+                "Hedged": row["hedged"],
+                "Rescued": row["rescued"],
+                "Total p50 (ms)": ms(row["total_p50"]),
+                "Total p95 (ms)": ms(row["total_p95"]),
+                "First token p50 (ms)": ms(row["ttft_p50"]),
+                "First token p95 (ms)": ms(row["ttft_p95"]),
+            }
+            for row in rows
+        ])
+        st.caption(f"From the last requests in {telemetry_log.path}")
+
+def saved_file_texts(paths):
+    """Current text of the given files in the saved context, for collapsed context updates"""
+    snapshot = st.session_state['context_snapshot']
+    if snapshot is None:
+        return {}
+    return {path: snapshot.file_contents[path] for path in paths if path in snapshot.file_contents}
+
+def get_history_manager(llm_config):
+    """Returns this session's ChatHistoryManager, creating it on first use"""
+    if st.session_state['history_manager'] is None:
+        st.session_state['history_manager'] = ChatHistoryManager(
+            st.session_state['llm_provider'],
+            resolve_history_budget(st.session_state['llm_provider'], llm_config["history_token_budget"]),
+            file_source=saved_file_texts
+        )
+    return st.session_state['history_manager']
 
 def extract_chunk_content(chunk):
     """Helper function to extract content from different chunk formats"""
@@ -222,13 +529,24 @@ def main():
     """Main application function"""
     # Setup and configuration
     setup_page_config()
+    install_notice_handler()
     config = load_configuration()
+    get_context_store(
+        max_megabytes=config.get('context_store_max_mb', DEFAULT_MAX_MEGABYTES),
+        idle_seconds=config.get('context_store_idle_minutes', DEFAULT_IDLE_SECONDS // 60) * 60,
+        spill=config.get('context_store_spill', True)
+    )
     initialize_session_state(config)
     
     # Initialize handlers
     global llm_handler, llm_chain_wrapper
     llm_handler = LLMHandler()
-    llm_chain_wrapper = LLMChainWrapper(llm_handler)
+    response_cache = get_shared_response_cache(
+        ttl_hours=config.get('response_cache_ttl_hours', TTL_HOURS),
+        max_megabytes=config.get('response_cache_max_mb', MAX_MEGABYTES)
+    )
+    llm_chain_wrapper = LLMChainWrapper(llm_handler, get_telemetry_log(config.get('telemetry_log_path', TELEMETRY_PATH)),
+                                        response_cache=response_cache, session_id=st.session_state['session_id'])
     
     # App title
     st.title("AI Code Assistant")
@@ -237,6 +555,7 @@ def main():
     with st.sidebar:
         st.header("Configuration")
         configure_llm_provider_settings(config)
+        show_performance_summary(llm_chain_wrapper.telemetry_log)
     
     # Right sidebar for code context
     with st.sidebar:
@@ -0,0 +1,369 @@
+# benchmark.py
+"""Offline benchmarks for the context pipeline and chat turns.
+
+Runs without network access or API keys: project trees are generated in a
+temporary directory and chat turns go to FakeStreamingLLM, which streams
+tokens at a configurable rate. Results are written as JSON so runs can be
+compared, e.g.
+
+    python benchmark.py --files 2000 --output before.json
+    python benchmark.py --files 2000 --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from file_manager import (CONTENT_CACHE, IGNORE_MATCHER, format_output_text, get_folder_tree,
+                          get_selected_files_content, get_tree_file_paths, get_tree_structure_string,
+                          save_context_file, save_goal_file)
+from tree_scanner import get_shared_scanner
+from llm import LLMHandler
+from llm_chain import LLMChainWrapper
+from chat_history import ChatHistoryManager, resolve_history_budget
+from telemetry import TelemetryLog
+
+FAKE_PROVIDER = "Ollama"
+FAKE_MODEL = "fake-stream"
+_WORDS = ["def", "return", "self", "value", "config", "index", "cache", "path", "token", "result",
+          "stream", "context", "message", "history", "file", "tree", "budget", "chunk", "query", "model"]
+
+
+class FakeStreamingLLM:
+    """Streams a canned response word by word at tokens_per_second, after first_token_latency seconds."""
+
+    def __init__(self, tokens_per_second=200.0, first_token_latency=0.05, response_tokens=200, sleep=time.sleep):
+        self.tokens_per_second = tokens_per_second
+        self.first_token_latency = first_token_latency
+        self.response_tokens = response_tokens
+        self.sleep = sleep
+        self.calls = 0
+
+    def stream(self, prompt):
+        self.calls += 1
+        if self.first_token_latency:
+            self.sleep(self.first_token_latency)
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+        for i in range(self.response_tokens):
+            if interval and i:
+                self.sleep(interval)
+            yield _WORDS[i % len(_WORDS)] + " "
+
+
+class FakeLLMHandler(LLMHandler):
+    """LLMHandler whose chat methods stream from a FakeStreamingLLM instead of a provider."""
+
+    def __init__(self, fake_llm):
+        super().__init__()
+        self.fake_llm = fake_llm
+
+    def openai_chat(self, prompt, *args, **kwargs):
+        return self.fake_llm.stream(prompt)
+
+    def azure_openai_chat(self, prompt, *args, **kwargs):
+        return self.fake_llm.stream(prompt)
+
+    def ollama_chat(self, prompt, *args, **kwargs):
+        return self.fake_llm.stream(prompt)
+
+
+def make_synthetic_project(root, files=500, files_per_dir=20, lines_per_file=120, seed=0):
+    """Writes a project of `files` source files under root and returns their paths.
+
+    Files are spread over nested package directories, files_per_dir per
+    directory; an ignored node_modules folder and a .gitignore are added so
+    ignore handling is exercised too.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        directory = root
+        n = i // files_per_dir
+        while True:
+            directory = os.path.join(directory, f"pkg{n % files_per_dir}")
+            n //= files_per_dir
+            if n == 0:
+                break
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"module_{i}.py")
+        lines = []
+        for j in range(lines_per_file):
+            if j % 15 == 0:
+                lines.append(f"def function_{i}_{j}(value, config):")
+                lines.append(f'    """Handles {rng.choice(_WORDS)} for function_{i}_{j}."""')
+            else:
+                words = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(3, 10)))
+                lines.append(f'    {rng.choice(_WORDS)}_{j} = "{words}"')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        paths.append(path)
+
+    ignored = os.path.join(root, "node_modules", "lib")
+    os.makedirs(ignored, exist_ok=True)
+    for i in range(max(files // 10, 1)):
+        with open(os.path.join(ignored, f"dep_{i}.js"), 'w', encoding='utf-8') as f:
+            f.write("module.exports = {};\n")
+    with open(os.path.join(root, ".gitignore"), 'w', encoding='utf-8') as f:
+        f.write("*.log\nbuild/\n")
+    return paths
+
+
+def measure(fn, repeat=5, setup=None):
+    """Runs fn `repeat` times and returns timings plus the tracemalloc peak of one extra run.
+
+    setup, if given, is called (untimed) before every run, e.g. to clear caches.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "repeat": repeat,
+        "min_seconds": min(timings),
+        "median_seconds": statistics.median(timings),
+        "max_seconds": max(timings),
+        "peak_memory_bytes": peak,
+    }, result
+
+
+def measure_import_time(module="app", top=15):
+    """Imports module in a fresh interpreter with -X importtime and breaks the time down by package.
+
+    Returns the total import time and the `top` packages by self time summed
+    over all their modules, so a provider SDK creeping back into startup shows up.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+    )
+    total = 0.0
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # header line
+        if not name.startswith("  "):
+            total += int(cumulative) / 1e6  # top-level import
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1e6
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "ok": result.returncode == 0,
+        "total_seconds": total,
+        "packages": dict(slowest),
+    }
+
+
+def _median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    """Runs the block with path as the working directory, so context/ files land there."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def clear_caches():
+    get_shared_scanner(IGNORE_MATCHER).clear()
+    CONTENT_CACHE.clear()
+
+
+def run_chat_turns(llm_chain_wrapper, fake_llm, turns, llm_config):
+    """Runs an initial turn and turns - 1 follow-ups, returning per-turn timings."""
+    chat_history = []
+    history_manager = ChatHistoryManager(FAKE_PROVIDER, resolve_history_budget(FAKE_PROVIDER, llm_config.get("history_token_budget")))
+    results = []
+    for turn in range(turns):
+        user_message = f"How does function_{turn}_0 use the config value?"
+        start = time.perf_counter()
+        if turn == 0:
+            stream = llm_chain_wrapper.get_initial_llm_response(user_message, FAKE_PROVIDER, llm_config)
+        else:
+            stream = llm_chain_wrapper.get_followup_llm_response(user_message, FAKE_PROVIDER, llm_config, chat_history, history_manager)
+        prompt_ready = time.perf_counter()
+        first_token = None
+        parts = []
+        for chunk in stream:
+            if first_token is None:
+                first_token = time.perf_counter()
+            parts.append(chunk)
+        end = time.perf_counter()
+        tokens = len(parts)
+        streaming = end - first_token if first_token is not None else None
+        results.append({
+            "turn": turn,
+            "kind": "initial" if turn == 0 else "followup",
+            "prompt_seconds": prompt_ready - start,
+            "time_to_first_token": first_token - start if first_token is not None else None,
+            "total_seconds": end - start,
+            "tokens": tokens,
+            "tokens_per_second": tokens / streaming if streaming else None,
+        })
+        chat_history.append({"role": "user", "content": user_message})
+        chat_history.append({"role": "assistant", "content": "".join(parts)})
+    return results
+
+
+def run_benchmarks(files=500, lines_per_file=120, repeat=5, turns=3, tokens_per_second=200.0,
+                   first_token_latency=0.05, response_tokens=200, seed=0, import_module="app"):
+    """Runs every benchmark in a temporary directory and returns the results dict."""
+    startup = measure_import_time(import_module) if import_module else None
+    workdir = tempfile.mkdtemp(prefix="code-assistant-bench-")
+    try:
+        project = os.path.join(workdir, "project")
+        os.makedirs(project)
+        make_synthetic_project(project, files=files, lines_per_file=lines_per_file, seed=seed)
+        results = {}
+        if startup is not None:
+            results["startup_imports"] = startup
+
+        results["get_folder_tree_cold"], tree_data = measure(lambda: get_folder_tree(project), repeat, setup=clear_caches)
+        results["get_folder_tree_warm"], tree_data = measure(lambda: get_folder_tree(project), repeat)
+        selected = get_tree_file_paths(tree_data)
+
+        results["get_selected_files_content_cold"], file_contents = measure(
+            lambda: get_selected_files_content(selected, project), repeat, setup=CONTENT_CACHE.clear)
+        results["get_selected_files_content_warm"], file_contents = measure(
+            lambda: get_selected_files_content(selected, project), repeat)
+
+        results["get_selected_files_content_outline"], outlines = measure(
+            lambda: get_selected_files_content(selected, project, outline=True), repeat)
+        results["get_selected_files_content_outline"]["output_chars"] = sum(len(text) for text in outlines.values())
+        results["get_selected_files_content_warm"]["output_chars"] = sum(len(text) for text in file_contents.values())
+
+        tree_str = get_tree_structure_string(tree_data)
+        results["format_output_text"], code_text = measure(lambda: format_output_text(tree_str, file_contents), repeat)
+        results["format_output_text"]["output_chars"] = len(code_text)
+
+        fake_llm = FakeStreamingLLM(tokens_per_second, first_token_latency, response_tokens)
+        telemetry_log = TelemetryLog(os.path.join(workdir, "telemetry.jsonl"))
+        llm_chain_wrapper = LLMChainWrapper(FakeLLMHandler(fake_llm), telemetry_log)
+        llm_config = {
+            "ollama_base_url": "http://fake",
+            "ollama_model_name_chat": FAKE_MODEL,
+            "project_path": project,
+            "vectorization_enabled": False,
+        }
+
+        with working_directory(workdir):
+            save_goal_file("Benchmark a synthetic project.")
+            save_context_file(format_output_text(tree_str, file_contents))
+            # Prompt construction alone: a response that streams nothing.
+            no_stream = FakeStreamingLLM(0, 0, 0)
+            prompt_wrapper = LLMChainWrapper(FakeLLMHandler(no_stream), TelemetryLog(os.devnull))
+            results["prompt_construction"], _ = measure(
+                lambda: list(prompt_wrapper.get_initial_llm_response("How is the config value used?", FAKE_PROVIDER, llm_config)),
+                repeat)
+            results["prompt_construction"]["prompt_tokens"] = prompt_wrapper.last_prompt_stats["prompt_tokens"]
+
+            tracemalloc.start()
+            try:
+                chat_turns = run_chat_turns(llm_chain_wrapper, fake_llm, turns, llm_config)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        results["chat_turns"] = {
+            "turns": chat_turns,
+            "peak_memory_bytes": peak,
+            "time_to_first_token_median": _median(t["time_to_first_token"] for t in chat_turns),
+            "tokens_per_second_median": _median(t["tokens_per_second"] for t in chat_turns),
+        }
+        results["telemetry"] = telemetry_log.summary()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "params": {
+                "files": files, "lines_per_file": lines_per_file, "repeat": repeat, "turns": turns,
+                "tokens_per_second": tokens_per_second, "first_token_latency": first_token_latency,
+                "response_tokens": response_tokens, "seed": seed, "import_module": import_module,
+            },
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline):
+    """Returns (name, metric, baseline, current, ratio) rows for metrics present in both runs."""
+    rows = []
+    for name, result in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not isinstance(result, dict) or not isinstance(old, dict):
+            continue
+        for metric in ("median_seconds", "total_seconds", "peak_memory_bytes", "time_to_first_token_median", "tokens_per_second_median"):
+            if result.get(metric) is not None and old.get(metric):
+                rows.append((name, metric, old[metric], result[metric], result[metric] / old[metric]))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the code assistant.")
+    parser.add_argument("--files", type=int, default=500, help="number of files in the synthetic project")
+    parser.add_argument("--lines-per-file", type=int, default=120)
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--turns", type=int, default=3, help="chat turns against the fake provider")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="fake provider streaming rate (0 = unthrottled)")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="fake provider delay before the first token, in seconds")
+    parser.add_argument("--response-tokens", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--import-module", default="app", help="module whose cold import time is measured ('' to skip)")
+    parser.add_argument("--output", help="write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        files=args.files, lines_per_file=args.lines_per_file, repeat=args.repeat, turns=args.turns,
+        tokens_per_second=args.tokens_per_second, first_token_latency=args.first_token_latency,
+        response_tokens=args.response_tokens, seed=args.seed, import_module=args.import_module,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        for name, metric, old, new, ratio in compare(report, baseline):
+            print(f"{name:35} {metric:28} {old:>14.4g} -> {new:<14.4g} x{ratio:.2f}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
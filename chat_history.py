@@ -0,0 +1,173 @@
+# chat_history.py
+from context_packer import TokenCounter
+
+# Tokens of chat history sent with each follow-up, per provider.
+# Override with `history_token_budget` in config.yaml.
+DEFAULT_HISTORY_BUDGETS = {
+    "OpenAI": 8000,
+    "Azure OpenAI": 8000,
+    "Ollama": 2000,
+}
+SUMMARY_SHARE = 4  # the rolling summary gets 1/SUMMARY_SHARE of the history budget
+SUMMARY_LINE_CHARS = 240
+PINNED_SHARE = 4  # pinned context updates get at most 1/PINNED_SHARE of the history budget
+COLLAPSED_UPDATES_HEADER = "Current content of project files changed earlier in this chat:\n"
+
+
+def resolve_history_budget(llm_provider, configured_budgets=None):
+    """Returns the history token budget for a provider from config, falling back to the defaults."""
+    if isinstance(configured_budgets, int):
+        return configured_budgets
+    if configured_budgets and llm_provider in configured_budgets:
+        return int(configured_budgets[llm_provider])
+    return DEFAULT_HISTORY_BUDGETS.get(llm_provider, DEFAULT_HISTORY_BUDGETS["Ollama"])
+
+
+def format_message(message):
+    return f"{message['role'].capitalize()}: {message['content']}\n\n"
+
+
+def summarize_message(message):
+    """One summary line per message: the role and the start of its first paragraph."""
+    first = message['content'].strip().split("\n\n", 1)[0].replace("\n", " ")
+    if len(first) > SUMMARY_LINE_CHARS:
+        first = first[:SUMMARY_LINE_CHARS].rsplit(" ", 1)[0] + " ..."
+    return f"- {message['role'].capitalize()}: {first}"
+
+
+class ChatHistoryManager:
+    """Formats chat history for follow-up prompts within a token budget.
+
+    The most recent messages are kept verbatim; messages that fall out of that
+    window are folded into a rolling summary once, when they leave it, instead
+    of re-summarizing the whole conversation each turn. Formatted text and
+    token counts are cached per message, so a turn only formats what is new.
+    Context updates (diffs of edited files) are never summarized: when they
+    leave the window they are pinned verbatim ahead of it, until the caller
+    re-sends the full context and calls drop_pinned_updates(). Once pinned
+    updates outgrow their share of the budget they are collapsed into one
+    message with the current text of the files they touched, from
+    file_source(paths) -> {path: text}, or just the file names when that
+    does not fit either.
+    Lives in st.session_state for the duration of a chat.
+    """
+
+    def __init__(self, llm_provider, budget, summarize=summarize_message, file_source=None):
+        self.summarize = summarize
+        self.file_source = file_source
+        self.summary_lines = []
+        self.summary_tokens = 0
+        self.window_start = 0  # index of the first message kept verbatim
+        self.pinned_updates = []  # (text, tokens, paths) of context updates that left the window
+        self._formatted = []  # (content, text, tokens) per message seen so far
+        self.last_stats = None
+        self.configure(llm_provider, budget)
+
+    def configure(self, llm_provider, budget):
+        """Updates provider and budget; cached token counts are dropped if the tokenizer changes."""
+        if getattr(self, "llm_provider", None) != llm_provider:
+            self.llm_provider = llm_provider
+            self.counter = TokenCounter(llm_provider)
+            self._formatted = []
+            self.summary_tokens = self.counter.count("\n".join(self.summary_lines))
+        self.budget = budget
+
+    def _sync(self, chat_history):
+        """Formats and counts only messages not seen before; resets if history was replaced."""
+        cached = len(self._formatted)
+        if cached > len(chat_history) or (cached and self._formatted[-1][0] != chat_history[cached - 1]['content']):
+            self.summary_lines = []
+            self.summary_tokens = 0
+            self.window_start = 0
+            self.pinned_updates = []
+            self._formatted = []
+            cached = 0
+        for message in chat_history[cached:]:
+            text = format_message(message)
+            self._formatted.append((message['content'], text, self.counter.count(text)))
+
+    def split(self, chat_history):
+        """Returns (summary_text, verbatim_messages) for chat_history within the budget.
+
+        The window only moves when the verbatim messages overflow the budget,
+        and then shrinks to half of it, so the summary (and any prompt prefix
+        built from it) changes every few turns rather than on every turn.
+        """
+        self._sync(chat_history)
+        summary_budget = self.budget // SUMMARY_SHARE
+        pinned_budget = self.budget // PINNED_SHARE
+        recent_budget = self.budget - min(self.summary_tokens, summary_budget) - min(self.pinned_tokens(), pinned_budget)
+
+        used = sum(tokens for _, _, tokens in self._formatted[self.window_start:])
+        start = self.window_start
+        if used > recent_budget:
+            # Grow the verbatim window backwards from the newest message.
+            start = len(self._formatted)
+            used = 0
+            while start > self.window_start and used + self._formatted[start - 1][2] <= recent_budget // 2:
+                start -= 1
+                used += self._formatted[start][2]
+            if start == len(self._formatted) and start > self.window_start:
+                # Always keep the latest message, even if it alone exceeds the budget.
+                start -= 1
+                used += self._formatted[start][2]
+
+        folded = 0
+        for index, message in enumerate(chat_history[self.window_start:start], self.window_start):
+            if message.get("kind") == "context_update":
+                self.pinned_updates.append(self._formatted[index][1:] + (message.get("paths") or [],))
+                continue
+            line = self.summarize(message)
+            self.summary_lines.append(line)
+            self.summary_tokens += self.counter.count(line) + 1
+            folded += 1
+        self.window_start = start
+        if self.pinned_tokens() > pinned_budget:
+            self._collapse_pinned(pinned_budget)
+        while self.summary_lines and self.summary_tokens > summary_budget:
+            dropped = self.summary_lines.pop(0)
+            self.summary_tokens -= self.counter.count(dropped) + 1
+
+        summary = ""
+        if self.summary_lines:
+            summary = "Summary of earlier conversation:\n" + "\n".join(self.summary_lines) + "\n\n"
+        self.last_stats = {
+            "verbatim_messages": len(self._formatted) - start,
+            "summarized_messages": start,
+            "newly_summarized": folded,
+            "pinned_updates": len(self.pinned_updates),
+            "history_tokens": used + self.summary_tokens + self.pinned_tokens(),
+        }
+        return summary, chat_history[start:]
+
+    def _collapse_pinned(self, pinned_budget):
+        """Replaces the pinned diffs with the current text of the files they touched, or their names."""
+        paths = list(dict.fromkeys(path for _, _, touched in self.pinned_updates for path in touched))
+        texts = self.file_source(paths) if self.file_source is not None and paths else {}
+        sections = "".join(f"=== File: {path} ===\n{texts[path]}\n" for path in paths if path in texts)
+        others = [path for path in paths if path not in texts]
+        if others:
+            sections += "Also changed or deleted: " + ", ".join(others) + "\n"
+        text = format_message({"role": "user", "content": COLLAPSED_UPDATES_HEADER + sections})
+        tokens = self.counter.count(text)
+        if tokens > pinned_budget:
+            text = format_message({"role": "user", "content": "Project files changed earlier in this chat (diffs omitted): "
+                                   + (", ".join(paths) or "unknown")})
+            tokens = self.counter.count(text)
+        self.pinned_updates = [(text, tokens, paths)]
+
+    def pinned_tokens(self):
+        return sum(tokens for _, tokens, _ in self.pinned_updates)
+
+    def pinned_text(self):
+        """The pinned context updates, oldest first, formatted like history messages."""
+        return "".join(text for text, _, _ in self.pinned_updates)
+
+    def drop_pinned_updates(self):
+        """Forgets pinned context updates once the full, current context has been sent again."""
+        self.pinned_updates = []
+
+    def format(self, chat_history):
+        """Returns the history text for the follow-up prompt."""
+        summary, _ = self.split(chat_history)
+        return summary + self.pinned_text() + "".join(text for _, text, _ in self._formatted[self.window_start:])
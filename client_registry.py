@@ -0,0 +1,169 @@
+# client_registry.py
+import hashlib
+import threading
+import time
+
+import requests
+
+IDLE_TIMEOUT_SECONDS = 15 * 60
+# Default (connect, read) timeouts for plain HTTP calls made with the shared session.
+HTTP_TIMEOUT = (3.05, 10)
+
+
+def fingerprint(secret):
+    """Short stable digest of a credential, so raw keys never appear in registry keys."""
+    if not secret:
+        return ""
+    return hashlib.sha256(secret.encode('utf-8')).hexdigest()[:16]
+
+
+def _close(client):
+    """Best-effort release of the HTTP resources held by a client."""
+    for candidate in (client, getattr(client, 'root_client', None), getattr(client, 'root_async_client', None)):
+        close = getattr(candidate, 'close', None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+
+
+class ClientRegistry:
+    """Process-wide cache of LLM client objects, so their connection pools survive reruns.
+
+    Clients are keyed by provider, credential fingerprint and model settings,
+    shared by every Streamlit session, and closed after IDLE_TIMEOUT_SECONDS
+    without use. A client checked out for a stream counts as in use until the
+    stream ends, however long that takes.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT_SECONDS, clock=time.monotonic):
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._clients = {}  # key -> [client, last_used, checkouts]
+        # Reentrant: a dropped LeasedStream releases its checkout from __del__, which may run mid-call.
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, factory, checkout=False):
+        """Returns the client for key, creating it with factory() on first use.
+
+        With checkout=True the client is not evicted until release(key) is called.
+        """
+        now = self.clock()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+                entry[2] += checkout
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        client = factory()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                # Another session created it meanwhile; keep the first one.
+                _close(client)
+                entry[1] = now
+                entry[2] += checkout
+                return entry[0]
+            self._clients[key] = [client, now, int(checkout)]
+        return client
+
+    def release(self, key):
+        """Ends a checkout made with get(key, factory, checkout=True); the idle time starts now."""
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = self.clock()
+                entry[2] = max(entry[2] - 1, 0)
+
+    def _evict_idle(self, now):
+        for key in [k for k, (_, last_used, checkouts) in self._clients.items()
+                    if not checkouts and now - last_used > self.idle_timeout]:
+            client, _, _ = self._clients.pop(key)
+            _close(client)
+
+    def clear(self):
+        with self._lock:
+            for client, _, _ in self._clients.values():
+                _close(client)
+            self._clients.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"clients": len(self._clients), "in_use": sum(1 for entry in self._clients.values() if entry[2]),
+                    "hits": self.hits, "misses": self.misses}
+
+
+class LeasedStream:
+    """A client's response stream (sync or async) that releases the client's checkout once it is over.
+
+    The checkout ends when the stream is exhausted, raises, is closed, or is
+    garbage collected without being finished.
+    """
+
+    def __init__(self, registry, key, stream):
+        self._registry = registry
+        self._key = key
+        self._stream = stream
+        self._released = False
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self._registry.release(self._key)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._stream)
+        except BaseException:
+            self._release()
+            raise
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._stream.__anext__()
+        except BaseException:
+            self._release()
+            raise
+
+    def close(self):
+        try:
+            close = getattr(self._stream, 'close', None)
+            if callable(close):
+                close()
+        finally:
+            self._release()
+
+    async def aclose(self):
+        try:
+            aclose = getattr(self._stream, 'aclose', None)
+            if callable(aclose):
+                await aclose()
+        finally:
+            self._release()
+
+    def __del__(self):
+        self._release()
+
+
+_registry = ClientRegistry()
+
+
+def get_client_registry():
+    return _registry
+
+
+def get_http_session():
+    """Shared requests.Session with connection keep-alive, e.g. for the Ollama REST API."""
+    return _registry.get(("http-session",), requests.Session)
@@ -0,0 +1,109 @@
+# code_outline.py
+import ast
+import os
+import threading
+from collections import OrderedDict
+
+OUTLINE_HEADER = "# Outline: function and method bodies omitted\n"
+MAX_ASSIGN_CHARS = 120
+DEFAULT_MAX_ENTRIES = 5000
+
+
+class _Outliner(ast.NodeTransformer):
+    """Strips a module down to imports, short assignments, signatures and docstrings."""
+
+    def _docstring_and_ellipsis(self, node):
+        body = []
+        if ast.get_docstring(node, clean=False) is not None:
+            body.append(node.body[0])
+        body.append(ast.Expr(ast.Constant(...)))
+        return body
+
+    def _outline_body(self, statements, keep_other=False):
+        kept = []
+        for index, statement in enumerate(statements):
+            if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                statement.body = self._docstring_and_ellipsis(statement)
+                kept.append(statement)
+            elif isinstance(statement, ast.ClassDef):
+                docstring = [statement.body[0]] if ast.get_docstring(statement, clean=False) is not None else []
+                rest = statement.body[len(docstring):]
+                statement.body = docstring + self._outline_body(rest) or [ast.Expr(ast.Constant(...))]
+                kept.append(statement)
+            elif isinstance(statement, (ast.Import, ast.ImportFrom)):
+                kept.append(statement)
+            elif isinstance(statement, (ast.Assign, ast.AnnAssign)):
+                kept.append(self._short_assign(statement))
+            elif keep_other and index == 0 and isinstance(statement, ast.Expr) and isinstance(getattr(statement, "value", None), ast.Constant) and isinstance(statement.value.value, str):
+                kept.append(statement)  # module docstring
+        return kept
+
+    def _short_assign(self, statement):
+        if statement.value is None or len(ast.unparse(statement.value)) <= MAX_ASSIGN_CHARS:
+            return statement
+        statement.value = ast.Constant(...)
+        return statement
+
+    def outline(self, tree):
+        tree.body = self._outline_body(tree.body, keep_other=True)
+        return tree
+
+
+def outline_python(source):
+    """Returns a compact outline of Python source, or None if it does not parse."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    return OUTLINE_HEADER + ast.unparse(_Outliner().outline(tree)) + "\n"
+
+
+def is_outlinable(path):
+    return path.endswith(('.py', '.pyi'))
+
+
+class OutlineCache:
+    """Outlines of Python files, reused while a file's mtime_ns and size are unchanged.
+
+    Source is read through a FileContentCache, so an outline miss does not
+    re-read a file whose content is already cached.
+    """
+
+    def __init__(self, content_cache, max_entries=DEFAULT_MAX_ENTRIES):
+        self.content_cache = content_cache
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # path -> (mtime_ns, size, outline)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def outline(self, path):
+        """Returns the outline of path, or its full text if it is not valid Python."""
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        text = self.content_cache.read(path)
+        outline = outline_python(text)
+        if outline is None:
+            outline = text
+
+        with self._lock:
+            self._entries.pop(path, None)
+            self._entries[path] = (st.st_mtime_ns, st.st_size, outline)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return outline
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,86 @@
+# content_cache.py
+import codecs
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_TOTAL_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_FILE_BYTES = 1024 * 1024
+SNIFF_BYTES = 8192
+
+
+class FileContentCache:
+    """In-process LRU cache of decoded file contents, bounded by total bytes.
+
+    Entries are keyed by path and only reused while the file's mtime_ns and
+    size are unchanged. Binary files are detected from their first bytes and
+    never decoded, and files above max_file_bytes are read only up to the cap.
+    """
+
+    def __init__(self, max_total_bytes=DEFAULT_MAX_TOTAL_BYTES, max_file_bytes=DEFAULT_MAX_FILE_BYTES):
+        self.max_total_bytes = max_total_bytes
+        self.max_file_bytes = max_file_bytes
+        self._entries = OrderedDict()  # path -> (mtime_ns, size, text, cost)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, path):
+        """Returns the text of path, reading it from disk only if it changed since the last call."""
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        text, cost = self._load(path, st.st_size)
+
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.total_bytes -= old[3]
+            if cost <= self.max_total_bytes:
+                self._entries[path] = (st.st_mtime_ns, st.st_size, text, cost)
+                self.total_bytes += cost
+                while self.total_bytes > self.max_total_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.total_bytes -= evicted[3]
+        return text
+
+    def _load(self, path, size):
+        with open(path, 'rb') as f:
+            head = f.read(min(SNIFF_BYTES, self.max_file_bytes))
+            if b'\x00' in head:
+                text = f"Binary file skipped ({size} bytes)"
+                return text, len(text)
+            rest = f.read(max(self.max_file_bytes - len(head), 0))
+        data = head + rest
+        truncated = size > len(data)
+        try:
+            # The incremental decoder tolerates a multi-byte character split by the cap.
+            text = codecs.getincrementaldecoder('utf-8')().decode(data, final=not truncated)
+        except UnicodeDecodeError:
+            text = f"Binary file skipped ({size} bytes, not valid UTF-8)"
+            return text, len(text)
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        if truncated:
+            text += f"\n... [truncated: showing first {len(data)} of {size} bytes]\n"
+        return text, len(data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
@@ -0,0 +1,241 @@
+# context_packer.py
+import math
+import os
+import re
+
+from context_writer import iter_context_sections
+
+_tiktoken = False  # not imported yet
+
+
+def _load_tiktoken():
+    """Imports tiktoken the first time an OpenAI counter is built, or returns None if it is not installed."""
+    global _tiktoken
+    if _tiktoken is False:
+        try:
+            import tiktoken
+        except ImportError:  # tiktoken is optional; fall back to the character heuristic
+            tiktoken = None
+        _tiktoken = tiktoken
+    return _tiktoken
+
+# Tokens available for goal + code context + user message, per provider.
+# Override with `context_token_budget` in config.yaml.
+DEFAULT_TOKEN_BUDGETS = {
+    "OpenAI": 100000,
+    "Azure OpenAI": 100000,
+    "Ollama": 6000,
+}
+CHARS_PER_TOKEN = 4
+MIN_TRUNCATED_TOKENS = 200
+
+_FILE_HEADER = re.compile(r"\n=== File: (.+) ===\n")
+_TREE_HEADER = "Folder Tree Structure:\n"
+_FILES_HEADER = "\n\nSelected File Contents:\n"
+_TERM = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+# Words that say nothing about which file a message is about.
+_STOP_WORDS = frozenset("""
+    about above after again all also and any are around because been before being below between both but
+    can cannot could did does doing done down each even every for from get gets got had has have having
+    her here hers him his how into its just let like make many may more most much must need not now off
+    once only other our ours out over own please same see she should some such than that the their theirs
+    them then there these they this those through too under until upon use used using very want was way
+    were what when where which while who whom why will with within without would yet you your yours
+""".split())
+
+
+class TokenCounter:
+    """Counts tokens with tiktoken for OpenAI models, or with a chars/4 heuristic otherwise."""
+
+    def __init__(self, llm_provider, model_name=None):
+        self.encoding = None
+        tiktoken = _load_tiktoken() if llm_provider in ("OpenAI", "Azure OpenAI") else None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name or "gpt-4o-mini")
+            except (KeyError, ValueError):
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    @property
+    def exact(self):
+        return self.encoding is not None
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+    def truncate(self, text, max_tokens):
+        """Returns the longest prefix of text that fits in max_tokens."""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            return self.encoding.decode(tokens[:max_tokens])
+        return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+def resolve_token_budget(llm_provider, configured_budgets=None):
+    """Returns the token budget for a provider from config, falling back to the defaults."""
+    if isinstance(configured_budgets, int):
+        return configured_budgets
+    if configured_budgets and llm_provider in configured_budgets:
+        return int(configured_budgets[llm_provider])
+    return DEFAULT_TOKEN_BUDGETS.get(llm_provider, DEFAULT_TOKEN_BUDGETS["Ollama"])
+
+
+def parse_context_text(code_context):
+    """Splits text written by format_output_text back into (tree_str, [(path, content)]).
+
+    Returns None if the text does not follow that layout.
+    """
+    if not code_context.startswith(_TREE_HEADER):
+        return None
+    split_at = code_context.find(_FILES_HEADER)
+    if split_at == -1:
+        return None
+    tree_str = code_context[len(_TREE_HEADER):split_at]
+    pos = split_at + len(_FILES_HEADER)
+    files = []
+    while pos < len(code_context):
+        header = _FILE_HEADER.match(code_context, pos)
+        if header is None:
+            return None
+        path = header.group(1)
+        footer = "\n" + "=" * (len(path) + 11) + "\n"
+        start = header.end()
+        # The footer is the first one followed by another file block or the end of the text.
+        end = code_context.find(footer, start)
+        while end != -1:
+            after = end + len(footer)
+            if after == len(code_context) or _FILE_HEADER.match(code_context, after):
+                break
+            end = code_context.find(footer, end + 1)
+        if end == -1:
+            return None
+        files.append((path, code_context[start:end]))
+        pos = end + len(footer)
+    return tree_str, files
+
+
+def _query_terms(text):
+    return {t for t in (t.lower() for t in _TERM.findall(text)) if t not in _STOP_WORDS}
+
+
+def _relevance_scores(files, terms):
+    """Scores each file by the query terms in its path (3 points) and content (1 point).
+
+    Points are weighted by how rare the term is among the files (inverse
+    document frequency): a term found in every file says nothing about which
+    one matters and weighs 0; one found in a single file weighs the most.
+    """
+    hits = []
+    for path, content in files:
+        path_lower = path.lower()
+        content_lower = content.lower()
+        hits.append(([t for t in terms if t in path_lower], [t for t in terms if t in content_lower]))
+    weights = {}
+    for term in terms:
+        matches = sum(1 for in_path, in_content in hits if term in in_path or term in in_content)
+        weights[term] = math.log((len(files) + 1) / (matches + 1))
+    return [sum(3 * weights[t] for t in in_path) + sum(weights[t] for t in in_content) for in_path, in_content in hits]
+
+
+def _file_mtime(project_path, rel_path):
+    if not project_path:
+        return 0
+    try:
+        return os.stat(os.path.join(project_path, rel_path)).st_mtime
+    except OSError:
+        return 0
+
+
+def pack_context(goal_content, code_context, user_message, counter, budget, project_path=None):
+    """Fits goal and code context into budget tokens.
+
+    Priority: the goal, the folder tree, then whole files ordered by relevance to
+    the user message and goal (most recently modified first on ties), then
+    truncated heads of the remaining files while budget is left. Returns
+    (goal_content, code_context, stats).
+    """
+    remaining = budget - counter.count(user_message)
+    goal_tokens = counter.count(goal_content)
+    if goal_tokens > remaining:
+        goal_content = counter.truncate(goal_content, max(remaining, 0))
+        goal_tokens = counter.count(goal_content)
+    remaining -= goal_tokens
+
+    stats = {
+        "budget": budget,
+        "exact_tokens": counter.exact,
+        "files_total": 0,
+        "files_included": 0,
+        "files_truncated": 0,
+        "files_omitted": [],
+    }
+
+    parsed = parse_context_text(code_context)
+    if parsed is None:
+        code_tokens = counter.count(code_context)
+        if code_tokens > remaining:
+            code_context = counter.truncate(code_context, max(remaining, 0))
+            code_context += "\n... [code context truncated to fit the token budget]\n"
+            stats["files_truncated"] = 1
+        stats["context_tokens"] = goal_tokens + counter.count(code_context)
+        return goal_content, code_context, stats
+
+    tree_str, files = parsed
+    stats["files_total"] = len(files)
+    overhead = counter.count("".join(iter_context_sections("", {})))
+    remaining -= overhead
+    tree_tokens = counter.count(tree_str)
+    # The tree is cheap orientation but must not crowd out the files themselves.
+    tree_cap = max(remaining // 4, 0)
+    if tree_tokens > tree_cap:
+        tree_str = counter.truncate(tree_str, tree_cap)
+        tree_str = tree_str[:tree_str.rfind("\n") + 1] + "  ... [tree truncated]\n"
+        tree_tokens = counter.count(tree_str)
+    remaining -= tree_tokens
+
+    scores = _relevance_scores(files, _query_terms(f"{user_message} {goal_content}"))
+    ranked = [item for _, item in sorted(
+        zip(scores, files),
+        key=lambda scored: (scored[0], _file_mtime(project_path, scored[1][0])),
+        reverse=True,
+    )]
+
+    packed = {}
+    leftover = []
+    for path, content in ranked:
+        block_tokens = counter.count("".join(iter_context_sections("", {path: content}))) - overhead
+        if block_tokens <= remaining:
+            packed[path] = content
+            remaining -= block_tokens
+            stats["files_included"] += 1
+        else:
+            leftover.append((path, content))
+
+    marker = "\n... [truncated to fit the token budget]"
+    for path, content in leftover:
+        block_overhead = counter.count("".join(iter_context_sections("", {path: marker}))) - overhead
+        available = remaining - block_overhead
+        if available < MIN_TRUNCATED_TOKENS:
+            stats["files_omitted"].append(path)
+            continue
+        head = counter.truncate(content, available)
+        packed[path] = head + marker
+        remaining -= counter.count(head) + block_overhead
+        stats["files_truncated"] += 1
+
+    # Keep the original file order so the context reads like the saved code.txt.
+    order = {path: i for i, (path, _) in enumerate(files)}
+    packed = dict(sorted(packed.items(), key=lambda item: order[item[0]]))
+    code_context = "".join(iter_context_sections(tree_str, packed))
+    if stats["files_omitted"]:
+        code_context += "\nOmitted to fit the token budget: " + ", ".join(stats["files_omitted"]) + "\n"
+    stats["context_tokens"] = goal_tokens + counter.count(code_context)
+    return goal_content, code_context, stats
@@ -0,0 +1,75 @@
+# context_snapshot.py
+import difflib
+
+from file_manager import get_selected_files_content
+
+DIFF_CONTEXT_LINES = 3
+UPDATE_HEADER = "The following project files changed since the code context was shared. Apply these changes to your view of the code:\n"
+
+
+class ContextUpdate:
+    """Changes found by ContextSnapshot.refresh: the message text plus sizes for display."""
+
+    def __init__(self, text, changed, deleted, diff_chars, full_chars):
+        self.text = text
+        self.changed = changed
+        self.deleted = deleted
+        self.diff_chars = diff_chars
+        self.full_chars = full_chars
+
+
+def file_diff(rel_path, old, new, context_lines=DIFF_CONTEXT_LINES):
+    """Unified diff of one file's content, as sent to the model."""
+    return "".join(difflib.unified_diff(
+        old.splitlines(keepends=True), new.splitlines(keepends=True),
+        fromfile=f"a/{rel_path}", tofile=f"b/{rel_path}", n=context_lines,
+    ))
+
+
+class ContextSnapshot:
+    """The file contents last shared with the model for a saved context.
+
+    refresh() re-reads the saved selection (unchanged files come from the
+    content cache), and describes each changed file as a unified diff, or in
+    full when the diff would be longer than the file. The snapshot then moves
+    to the new contents, so every update is relative to what the model has
+    already seen.
+    """
+
+    def __init__(self, project_path, selected_files, tree_str, file_contents, outline=False, pinned_files=()):
+        self.project_path = project_path
+        self.selected_files = list(selected_files)
+        self.tree_str = tree_str
+        self.file_contents = dict(file_contents)
+        self.outline = outline
+        self.pinned_files = list(pinned_files)
+
+    def refresh(self):
+        """Returns a ContextUpdate for files changed since the last refresh, or None."""
+        current = get_selected_files_content(self.selected_files, self.project_path, self.outline, self.pinned_files)
+        sections = []
+        changed = []
+        deleted = []
+        diff_chars = 0
+        full_chars = 0
+        for rel_path, old in self.file_contents.items():
+            new = current.get(rel_path)
+            if new is None:
+                deleted.append(rel_path)
+                sections.append(f"File deleted: {rel_path}\n")
+                continue
+            if new == old:
+                continue
+            changed.append(rel_path)
+            full_chars += len(new)
+            diff = file_diff(rel_path, old, new)
+            if len(diff) < len(new):
+                sections.append(diff if diff.endswith("\n") else diff + "\n")
+                diff_chars += len(diff)
+            else:
+                sections.append(f"=== File: {rel_path} (full new content) ===\n{new}\n")
+                diff_chars += len(new)
+        if not sections:
+            return None
+        self.file_contents = {rel_path: content for rel_path, content in current.items() if rel_path in self.file_contents}
+        return ContextUpdate(UPDATE_HEADER + "\n" + "\n".join(sections), changed, deleted, diff_chars, full_chars)
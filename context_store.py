@@ -0,0 +1,193 @@
+# context_store.py
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from context_writer import write_atomic
+
+SESSIONS_DIR = os.path.join('context', 'sessions')
+CONTEXT_NAMES = ("goal", "code")
+DEFAULT_MAX_MEGABYTES = 256
+DEFAULT_IDLE_SECONDS = 60 * 60
+SWEEP_INTERVAL_SECONDS = 60
+
+
+_removal_hooks = []
+
+
+def on_session_removed(hook):
+    """Registers hook(session_dir), called after a session's directory is deleted (by remove or the idle sweep)."""
+    _removal_hooks.append(hook)
+
+
+def _delete_session_dir(path):
+    shutil.rmtree(path, ignore_errors=True)
+    for hook in _removal_hooks:
+        hook(path)
+
+
+class ContextStore:
+    """Goal and code context per session, kept in memory so loading them is free.
+
+    Sessions are isolated by id. When the texts held in memory exceed
+    max_megabytes, the least recently used sessions are spilled to
+    SESSIONS_DIR/<session_id>/ (or dropped, with spill disabled) and read back
+    on next use. Sessions unused for idle_seconds are removed, from memory and
+    disk. Session directories found on startup count as spilled, so they
+    survive a restart and still expire.
+    """
+
+    def __init__(self, max_megabytes=DEFAULT_MAX_MEGABYTES, idle_seconds=DEFAULT_IDLE_SECONDS, spill=True,
+                 sessions_dir=SESSIONS_DIR, clock=time.time):
+        self.max_bytes = int(max_megabytes * 1024 * 1024)
+        self.idle_seconds = idle_seconds
+        self.spill = spill
+        self.sessions_dir = sessions_dir
+        self.clock = clock
+        self._sessions = OrderedDict()  # session_id -> {"texts": {name: text}, "bytes": int, "last_used": float}
+        self._spilled = {}  # session_id -> last_used, for sessions whose texts are on disk only
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self._last_sweep = clock()
+        self._scan_sessions_dir()
+
+    def _scan_sessions_dir(self):
+        """Registers session directories left by an earlier process as spilled, aged by their mtime.
+
+        Their texts are then read back on use, and they are swept like any other idle session.
+        """
+        try:
+            entries = list(os.scandir(self.sessions_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_dir():
+                try:
+                    self._spilled[entry.name] = entry.stat().st_mtime
+                except OSError:
+                    continue
+
+    def session_dir(self, session_id):
+        return os.path.join(self.sessions_dir, session_id)
+
+    def _spill_path(self, session_id, name):
+        return os.path.join(self.session_dir(session_id), f"{name}.txt")
+
+    def put(self, session_id, name, text):
+        """Stores a context text ("goal" or "code") for session_id; text may be an iterable of pieces."""
+        if name not in CONTEXT_NAMES:
+            raise ValueError(f"Unknown context name: {name}")
+        if not isinstance(text, str):
+            text = "".join(text)
+        size = len(text.encode('utf-8'))
+        now = self.clock()
+        with self._lock:
+            entry = self._load(session_id)
+            old = entry["texts"].get(name)
+            if old is not None:
+                entry["bytes"] -= len(old.encode('utf-8'))
+                self.total_bytes -= len(old.encode('utf-8'))
+            entry["texts"][name] = text
+            entry["bytes"] += size
+            entry["last_used"] = now
+            self.total_bytes += size
+            self._sessions.move_to_end(session_id)
+            self._enforce_cap(keep=session_id)
+            self._maybe_sweep(now)
+        return size
+
+    def get(self, session_id, name):
+        """Returns the stored text, or None if the session has not saved it (or it expired)."""
+        now = self.clock()
+        with self._lock:
+            if session_id not in self._sessions and session_id not in self._spilled:
+                return None
+            entry = self._load(session_id)
+            entry["last_used"] = now
+            self._sessions.move_to_end(session_id)
+            self._enforce_cap(keep=session_id)
+            self._maybe_sweep(now)
+            return entry["texts"].get(name)
+
+    def _load(self, session_id):
+        """The in-memory entry for session_id, reading spilled texts back from disk. Call with the lock held."""
+        entry = self._sessions.get(session_id)
+        if entry is not None:
+            return entry
+        entry = {"texts": {}, "bytes": 0, "last_used": self.clock()}
+        if self._spilled.pop(session_id, None) is not None:
+            for name in CONTEXT_NAMES:
+                try:
+                    with open(self._spill_path(session_id, name), 'r', encoding='utf-8') as f:
+                        entry["texts"][name] = f.read()
+                except FileNotFoundError:
+                    continue
+                entry["bytes"] += len(entry["texts"][name].encode('utf-8'))
+            self.total_bytes += entry["bytes"]
+        self._sessions[session_id] = entry
+        return entry
+
+    def _enforce_cap(self, keep):
+        for session_id in list(self._sessions):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if session_id != keep:
+                self._evict(session_id, spill=self.spill)
+
+    def _evict(self, session_id, spill):
+        entry = self._sessions.pop(session_id)
+        self.total_bytes -= entry["bytes"]
+        if spill and entry["texts"]:
+            for name, text in entry["texts"].items():
+                write_atomic(self._spill_path(session_id, name), text)
+            self._spilled[session_id] = entry["last_used"]
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep >= SWEEP_INTERVAL_SECONDS:
+            self._last_sweep = now
+            self._sweep(now)
+
+    def _sweep(self, now):
+        """Removes sessions idle for longer than idle_seconds. Call with the lock held."""
+        cutoff = now - self.idle_seconds
+        for session_id in [s for s, entry in self._sessions.items() if entry["last_used"] < cutoff]:
+            self._evict(session_id, spill=False)
+            _delete_session_dir(self.session_dir(session_id))
+        for session_id in [s for s, last_used in self._spilled.items() if last_used < cutoff]:
+            del self._spilled[session_id]
+            _delete_session_dir(self.session_dir(session_id))
+
+    def sweep(self):
+        with self._lock:
+            self._sweep(self.clock())
+
+    def remove(self, session_id):
+        """Forgets a session and deletes its directory."""
+        with self._lock:
+            if session_id in self._sessions:
+                self._evict(session_id, spill=False)
+            self._spilled.pop(session_id, None)
+        _delete_session_dir(self.session_dir(session_id))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions_in_memory": len(self._sessions),
+                "sessions_spilled": len(self._spilled),
+                "total_bytes": self.total_bytes,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_context_store(max_megabytes=DEFAULT_MAX_MEGABYTES, idle_seconds=DEFAULT_IDLE_SECONDS, spill=True):
+    """Returns the process-wide store; its limits are taken from the first call."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ContextStore(max_megabytes, idle_seconds, spill)
+        return _store
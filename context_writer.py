@@ -0,0 +1,73 @@
+# context_writer.py
+import os
+import tempfile
+
+PREVIEW_CHARS = 20000
+
+
+def iter_tree_lines(tree_data, indent=0):
+    """Yields one line per node of a streamlit-tree-select tree."""
+    for node in tree_data or []:
+        yield "  " * indent + "- " + node['label'] + "\n"
+        if 'children' in node:
+            yield from iter_tree_lines(node['children'], indent + 1)
+
+
+def iter_context_sections(tree_structure_str, file_contents):
+    """Yields the context text piece by piece: the tree, then a block per file.
+
+    Joining the pieces gives exactly the text format_output_text has always
+    produced, without ever holding more than one file's content in a new string.
+    """
+    yield "Folder Tree Structure:\n"
+    yield tree_structure_str
+    yield "\n\nSelected File Contents:\n"
+    for filepath, content in file_contents.items():
+        yield f"\n=== File: {filepath} ===\n"
+        yield content
+        yield "\n" + "=" * (len(filepath) + 11) + "\n"
+
+
+def context_length(tree_structure_str, file_contents):
+    """Length of the joined context in characters, computed without building it."""
+    return sum(len(piece) for piece in iter_context_sections(tree_structure_str, file_contents))
+
+
+def render_head(pieces, max_chars=PREVIEW_CHARS):
+    """Joins pieces until max_chars is reached; returns (head, truncated)."""
+    head = []
+    remaining = max_chars
+    for piece in pieces:
+        if len(piece) > remaining:
+            head.append(piece[:remaining])
+            return "".join(head), True
+        head.append(piece)
+        remaining -= len(piece)
+    return "".join(head), False
+
+
+def write_atomic(file_path, pieces):
+    """Streams pieces (a string or an iterable of strings) to file_path via a temp file and rename.
+
+    Readers of file_path see either the previous file or the complete new one.
+    Returns the number of characters written.
+    """
+    if isinstance(pieces, str):
+        pieces = (pieces,)
+    directory = os.path.dirname(file_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(file_path), suffix='.tmp')
+    written = 0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for piece in pieces:
+                f.write(piece)
+                written += len(piece)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return written
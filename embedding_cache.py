@@ -0,0 +1,143 @@
+# embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from vector_index import MAX_BATCH_CHARS, embed_in_batches, iter_batches
+
+CACHE_PATH = os.path.join('context', 'embedding_cache.sqlite3')
+MAX_AGE_DAYS = 30
+MAX_ENTRIES = 500000
+_SQL_BATCH = 500
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent embeddings keyed by (embedding model, chunk content hash).
+
+    Backed by a SQLite file so entries survive restarts and can be added
+    incrementally. Entries unused for max_age_days are removed after each
+    indexing run, and the least recently used ones beyond max_entries too.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_age_days=MAX_AGE_DAYS, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_age_days = max_age_days
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model_id TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model_id, content_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, model_id, hashes):
+        """Returns {hash: vector} for the hashes present, marking them as used."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(unique), _SQL_BATCH):
+                batch = unique[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model_id = ? AND content_hash IN ({placeholders})",
+                    [model_id, *batch],
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = np.frombuffer(blob, dtype=np.float32)
+                self._conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE model_id = ? AND content_hash IN ({placeholders})",
+                    [now, model_id, *batch],
+                )
+            self._conn.commit()
+        return found
+
+    def put_many(self, model_id, items):
+        """Stores [(hash, vector)] for model_id."""
+        now = time.time()
+        rows = [(model_id, digest, np.asarray(vector, dtype=np.float32).tobytes(), now) for digest, vector in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model_id, content_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def collect_garbage(self):
+        """Removes stale entries; returns how many were deleted."""
+        cutoff = time.time() - self.max_age_days * 86400
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM embeddings WHERE last_used < ?", (cutoff,)).rowcount
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                removed += self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN"
+                    " (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                ).rowcount
+            self._conn.commit()
+        return removed
+
+    def embed(self, embeddings, model_id, texts, batch_size, max_batch_chars=MAX_BATCH_CHARS):
+        """Embeds texts, sending only cache misses to the provider.
+
+        Returns (matrix, stats) where stats reports the hit rate and the
+        embedding requests saved compared to embedding every text.
+        """
+        hashes = [content_hash(text) for text in texts]
+        cached = self.get_many(model_id, hashes)
+
+        missing = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in cached and digest not in missing:
+                missing[digest] = text
+        missing_hashes = list(missing)
+        new_vectors, calls = embed_in_batches(embeddings, list(missing.values()), batch_size, max_batch_chars)
+        if missing_hashes:
+            self.put_many(model_id, zip(missing_hashes, new_vectors))
+            cached.update(zip(missing_hashes, new_vectors))
+
+        full_calls = sum(1 for _ in iter_batches(texts, batch_size, max_batch_chars))
+        hits = sum(1 for digest in hashes if digest not in missing)
+        stats = {
+            "chunks": len(texts),
+            "cache_hits": hits,
+            "cache_misses": len(texts) - hits,
+            "hit_rate": hits / len(texts) if texts else 0.0,
+            "embedding_calls": calls,
+            "embedding_calls_saved": full_calls - calls,
+            "gc_removed": self.collect_garbage(),
+        }
+        matrix = np.stack([cached[digest] for digest in hashes]) if hashes else np.zeros((0, 0), dtype=np.float32)
+        return matrix, stats
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_embedding_cache(path=CACHE_PATH):
+    """Returns the process-wide cache for path."""
+    with _shared_lock:
+        cache = _shared.get(path)
+        if cache is None:
+            cache = EmbeddingCache(path)
+            _shared[path] = cache
+        return cache
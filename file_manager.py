@@ -1,117 +1,131 @@
-import streamlit as st
+import logging
 import os
-from streamlit_tree_select import tree_select
+from tree_scanner import get_shared_scanner
+from ignore_matcher import IgnoreMatcher
+from content_cache import FileContentCache
+from code_outline import OutlineCache, is_outlinable
+from context_store import get_context_store
+from context_writer import (PREVIEW_CHARS, iter_tree_lines, iter_context_sections,
+                            context_length, render_head, write_atomic)
+
+# Warnings and errors go to this logger; app.py shows them on the page, api_server.py logs them.
+logger = logging.getLogger(__name__)
 
 # Define ignore lists (simplified display)
 FOLDER_IGNORE = {'.git', 'node_modules', '__pycache__', 'venv', '.vscode', 'dist', 'build', '.idea', '.DS_Store'}
 FILE_IGNORE = {'.pyc', '.pyo', '.pyd', '.db', '.sqlite', '.sqlite3', '.sql', '.exe', '.dll', '.so', '.dylib', '.bin', '.dat', '.pkl', '.jpg', '.jpeg', '.png', '.gif', '.pdf', '.DS_Store', '.env'}
 
+# Compiled once; also applies .gitignore/.ignore files found while walking a project.
+IGNORE_MATCHER = IgnoreMatcher(FOLDER_IGNORE, FILE_IGNORE)
+
+# Shared by all sessions; unchanged files (same mtime and size) are never re-read.
+CONTENT_CACHE = FileContentCache()
+OUTLINE_CACHE = OutlineCache(CONTENT_CACHE)
+
 def should_ignore(name, is_dir=False):
     """Check if a file or folder should be ignored."""
-    if is_dir:  
-        return name in FOLDER_IGNORE
-    return any(name.endswith(ext) for ext in FILE_IGNORE)
-
-def get_folder_tree(folder_path):
-    """Recursively builds the tree structure for streamlit-tree-select."""
-    def get_tree_nodes(path):
-        nodes = []
-        try:
-            for item in os.listdir(path):
-                item_path = os.path.join(path, item)
-                is_dir = os.path.isdir(item_path)
-                
-                if should_ignore(item, is_dir):
-                    continue
-                    
-                if is_dir:
-                    children = get_tree_nodes(item_path)
-                    if children:
-                        nodes.append({
-                            "label": item,
-                            "value": item_path,
-                            "children": children,
-                        })
-                else:
-                    nodes.append({"label": item, "value": item_path})
-        except PermissionError:
-            st.warning(f"Permission denied accessing {path}")
-        return nodes
-
-    base_name = os.path.basename(folder_path)
-    return [{"label": base_name, "value": folder_path, "children": get_tree_nodes(folder_path)}]
-
-def get_selected_files_content(selected_files, base_path):
-    """Reads the content of selected files."""
+    return IGNORE_MATCHER.base_ignored(name, is_dir)
+
+def get_folder_tree(folder_path, scan_stats=None):
+    """Builds the tree structure for streamlit-tree-select, reusing cached directory scans."""
+    if scan_stats is None:
+        scan_stats = {}
+    tree = get_shared_scanner(IGNORE_MATCHER).scan(folder_path, scan_stats)
+    for path in scan_stats["errors"]:
+        logger.warning(f"Permission denied accessing {path}")
+    return tree
+
+def get_tree_file_paths(tree_data):
+    """Returns the paths of all files in a get_folder_tree result, as if every file were selected."""
+    paths = []
+    stack = list(tree_data)
+    while stack:
+        node = stack.pop()
+        if "children" in node:
+            stack.extend(node["children"])
+        else:
+            paths.append(node["value"])
+    return paths
+
+def get_tree_scan_stats():
+    """Returns cumulative hit/miss/pruned counters of the shared tree scanner."""
+    return get_shared_scanner(IGNORE_MATCHER).stats()
+
+def get_selected_files_content(selected_files, base_path, outline=False, pinned_files=()):
+    """Reads the content of selected files, served from CONTENT_CACHE when unchanged.
+
+    With outline=True, Python files other than pinned_files are reduced to
+    their imports, signatures and docstrings (see code_outline).
+    """
     file_contents = {}
+    pinned = {os.path.normpath(path) for path in pinned_files}
     if selected_files:
+        is_ignored = IGNORE_MATCHER.path_filter(base_path)
         for path in selected_files:
-            if os.path.isfile(path) and not should_ignore(os.path.basename(path)):
+            if os.path.isfile(path) and not is_ignored(path):
                 try:
                     # Get relative path from base directory
                     rel_path = os.path.relpath(path, base_path)
-                    with open(path, 'r', encoding='utf-8') as f:
-                        file_contents[rel_path] = f.read()
+                    if outline and os.path.normpath(path) not in pinned and is_outlinable(path):
+                        file_contents[rel_path] = OUTLINE_CACHE.outline(path)
+                    else:
+                        file_contents[rel_path] = CONTENT_CACHE.read(path)
                 except Exception as e:
                     file_contents[rel_path] = f"Error reading file: {e}"
     return file_contents
 
 def get_tree_structure_string(tree_data):
     """Converts the tree data to a string for output."""
-    def tree_to_string(nodes, indent=0):
-        tree_str = ""
-        for node in nodes:
-            tree_str += "  " * indent + "- " + node['label'] + "\n"
-            if 'children' in node:
-                tree_str += tree_to_string(node['children'], indent + 1)
-        return tree_str
-
-    tree_string = ""
-    if tree_data:
-        tree_string = tree_to_string(tree_data)
-    return tree_string
+    return "".join(iter_tree_lines(tree_data))
 
 def format_output_text(tree_structure_str, file_contents):
     """Formats the output text with tree structure and file contents."""
-    output_text = "Folder Tree Structure:\n"
-    output_text += tree_structure_str + "\n\n"
-    output_text += "Selected File Contents:\n"
-    for filepath, content in file_contents.items():
-        output_text += f"\n=== File: {filepath} ===\n"  
-        output_text += content + "\n"
-        output_text += "=" * (len(filepath) + 11) + "\n"  
-    return output_text
+    return "".join(iter_context_sections(tree_structure_str, file_contents))
 
+def format_output_preview(tree_structure_str, file_contents, max_chars=PREVIEW_CHARS):
+    """Returns (head, total_chars) where head is at most max_chars of the formatted output."""
+    head, _ = render_head(iter_context_sections(tree_structure_str, file_contents), max_chars)
+    return head, context_length(tree_structure_str, file_contents)
 
 
+def save_context_file(content, session_id=None):
+    """Saves the content (a string or an iterable of string sections) as the code context.
 
-def save_context_file(content):
-    """Saves the content to a context.txt file in the code folder."""
+    With a session_id it goes to that session's entry in the context store;
+    otherwise to context/code.txt, atomically.
+    """
     try:
-        os.makedirs('context', exist_ok=True)
-        file_path = os.path.join('context', 'code.txt')
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        if session_id is not None:
+            get_context_store().put(session_id, "code", content)
+        else:
+            write_atomic(os.path.join('context', 'code.txt'), content)
         return True
     except Exception as e:
-        st.error(f"Error saving file: {e}")
+        logger.error(f"Error saving file: {e}")
         return False
 
 
-def save_goal_file(goal_text):
-    """Saves the goal text to a goal.txt file in the context folder."""
+def save_goal_file(goal_text, session_id=None):
+    """Saves the goal text to the session's context store entry, or to a goal.txt file in the context folder."""
     try:
+        if session_id is not None:
+            get_context_store().put(session_id, "goal", goal_text)
+            return True
         os.makedirs('context', exist_ok=True)
         file_path = os.path.join('context', 'goal.txt')
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(goal_text)
         return True
     except Exception as e:
-        st.error(f"Error saving goal file: {e}")
+        logger.error(f"Error saving goal file: {e}")
         return False
 
-def read_goal_file():
-    """Reads the goal text from goal.txt if it exists, returns empty string if not."""
+def read_goal_file(session_id=None):
+    """Reads the session's goal, falling back to goal.txt if it exists; returns empty string if neither does."""
+    if session_id is not None:
+        goal_text = get_context_store().get(session_id, "goal")
+        if goal_text is not None:
+            return goal_text
     file_path = os.path.join('context', 'goal.txt')
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -119,5 +133,5 @@ def read_goal_file():
     except FileNotFoundError:
         return ""
     except Exception as e:
-        st.error(f"Error reading goal file: {e}")
-        return ""
\ No newline at end of file
+        logger.error(f"Error reading goal file: {e}")
+        return ""
@@ -0,0 +1,286 @@
+# ignore_matcher.py
+import os
+import re
+import threading
+
+IGNORE_FILENAMES = ('.gitignore', '.ignore')
+
+
+def _glob_to_regex(pattern):
+    """Translates a gitignore glob into a regex body matched against '/'-separated paths."""
+    i, n = 0, len(pattern)
+    out = []
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i + 3] == '**/':
+                out.append('(?:.*/)?')
+                i += 3
+                continue
+            if pattern[i:i + 2] == '**':
+                out.append('.*')
+                i += 2
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            j = pattern.find(']', i + 2 if pattern[i + 1:i + 2] in ('!', '^') else i + 1)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j]
+                if body[:1] in ('!', '^'):
+                    body = '^' + body[1:]
+                out.append('[' + body.replace('\\', '\\\\') + ']')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+def _has_glob(pattern):
+    return any(c in pattern for c in '*?[\\')
+
+
+class _Rule:
+    """A single compiled ignore pattern."""
+    __slots__ = ('negate', 'dir_only', 'anchored', 'regex')
+
+    def __init__(self, negate, dir_only, anchored, regex):
+        self.negate = negate
+        self.dir_only = dir_only
+        self.anchored = anchored
+        self.regex = regex
+
+
+class IgnoreRuleset:
+    """Patterns from one ignore source, compiled into set and regex lookups.
+
+    Rulesets without negations are collapsed into name/suffix sets plus one
+    combined regex each for basename and anchored path patterns. Rulesets that
+    use '!' keep an ordered rule list so the last matching pattern wins.
+    """
+
+    # Lookup tables are indexed by which entries a pattern applies to.
+    ANY, DIRS, FILES = 0, 1, 2
+
+    def __init__(self, lines=(), dir_names=(), file_suffixes=()):
+        self.rules = []
+        self.names = (set(), set(dir_names), set())
+        self.ext_suffixes = (set(), set(), set())
+        self.other_suffixes = (set(), set(), set())
+        basename_regexes = ([], [], [])
+        path_regexes = ([], [], [])
+
+        for suffix in file_suffixes:
+            self._add_suffix(suffix, self.FILES)
+
+        for line in lines:
+            rule = self._parse(line)
+            if rule is None:
+                continue
+            pattern, negate, dir_only, anchored = rule
+            body = _glob_to_regex(pattern)
+            self.rules.append(_Rule(negate, dir_only, anchored, re.compile(body)))
+            if negate:
+                continue
+            kind = self.DIRS if dir_only else self.ANY
+            if anchored:
+                path_regexes[kind].append(body)
+            elif not _has_glob(pattern):
+                self.names[kind].add(pattern)
+            elif pattern.startswith('*') and not _has_glob(pattern[1:]):
+                self._add_suffix(pattern[1:], kind)
+            else:
+                basename_regexes[kind].append(body)
+
+        self.has_negation = any(rule.negate for rule in self.rules)
+        self.basename_regex = tuple(self._combine(r) for r in basename_regexes)
+        self.path_regex = tuple(self._combine(r) for r in path_regexes)
+
+    def _add_suffix(self, suffix, kind):
+        # Plain ".ext" suffixes become a set lookup on the final extension.
+        if suffix.startswith('.') and suffix.count('.') == 1:
+            self.ext_suffixes[kind].add(suffix)
+        else:
+            self.other_suffixes[kind].add(suffix)
+
+    @staticmethod
+    def _combine(bodies):
+        if not bodies:
+            return None
+        return re.compile('|'.join(f'(?:{b})' for b in bodies))
+
+    @staticmethod
+    def _parse(line):
+        line = line.rstrip('\n').rstrip('\r')
+        if not line or line.startswith('#'):
+            return None
+        # Trailing spaces are ignored unless escaped.
+        while line.endswith(' ') and not line.endswith('\\ '):
+            line = line[:-1]
+        if not line:
+            return None
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            return None
+        anchored = '/' in line
+        line = line.lstrip('/')
+        if line.startswith('**/') and '/' not in line[3:]:
+            # "**/foo" is equivalent to an unanchored "foo".
+            line = line[3:]
+            anchored = False
+        return line, negate, dir_only, anchored
+
+    def _suffix_hit(self, name, kinds):
+        dot = name.rfind('.')
+        ext = name[dot:] if dot != -1 else None
+        for kind in kinds:
+            if ext is not None and ext in self.ext_suffixes[kind]:
+                return True
+            for suffix in self.other_suffixes[kind]:
+                if name.endswith(suffix):
+                    return True
+        return False
+
+    def match(self, rel_path, name, is_dir):
+        """Returns True if ignored, False if explicitly re-included, None if no pattern matched."""
+        if self.has_negation:
+            for rule in reversed(self.rules):
+                if rule.dir_only and not is_dir:
+                    continue
+                target = rel_path if rule.anchored else name
+                if rule.regex.fullmatch(target):
+                    return not rule.negate
+            return None
+
+        kinds = (self.ANY, self.DIRS) if is_dir else (self.ANY, self.FILES)
+        for kind in kinds:
+            if name in self.names[kind]:
+                return True
+        if self._suffix_hit(name, kinds):
+            return True
+        for kind in kinds:
+            regex = self.basename_regex[kind]
+            if regex is not None and regex.fullmatch(name):
+                return True
+            regex = self.path_regex[kind]
+            if regex is not None and regex.fullmatch(rel_path):
+                return True
+        return None
+
+
+class IgnoreContext:
+    """The rulesets in effect for one directory, deepest first."""
+    __slots__ = ('chain', 'signature')
+
+    def __init__(self, chain, signature):
+        self.chain = chain  # [(ruleset, prefix of this dir relative to the ruleset's dir)]
+        self.signature = signature
+
+    def ignored(self, name, is_dir):
+        for ruleset, prefix in self.chain:
+            result = ruleset.match(prefix + name, name, is_dir)
+            if result is not None:
+                return result
+        return False
+
+
+class IgnoreMatcher:
+    """Hierarchical .gitignore/.ignore matcher layered on top of fixed name/suffix ignores."""
+
+    def __init__(self, folder_ignore=(), file_ignore=(), ignore_filenames=IGNORE_FILENAMES):
+        self.ignore_filenames = tuple(ignore_filenames)
+        self.base = IgnoreRuleset(dir_names=folder_ignore, file_suffixes=file_ignore)
+        self._rulesets = {}
+        self._lock = threading.Lock()
+
+    def base_ignored(self, name, is_dir=False):
+        """Checks only the fixed folder/file ignore lists."""
+        return bool(self.base.match(name, name, is_dir))
+
+    def base_context(self):
+        return IgnoreContext([(self.base, '')], ())
+
+    def _load_ruleset(self, path, key):
+        with self._lock:
+            cached = self._rulesets.get(path)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                ruleset = IgnoreRuleset(f.readlines())
+        except OSError:
+            ruleset = IgnoreRuleset()
+        with self._lock:
+            self._rulesets[path] = (key, ruleset)
+        return ruleset
+
+    def child_context(self, parent, dir_name, dir_path, present_names):
+        """Context for dir_path given its parent's context and the ignore files found in it.
+
+        Pass dir_name=None for the scan root.
+        """
+        chain = [(ruleset, prefix + dir_name + '/') if dir_name is not None else (ruleset, prefix)
+                 for ruleset, prefix in parent.chain]
+        signature = parent.signature
+        own = []
+        for filename in self.ignore_filenames:
+            if filename not in present_names:
+                continue
+            path = os.path.join(dir_path, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            key = (st.st_mtime_ns, st.st_size)
+            own.append((path, key))
+        if own:
+            # .ignore is listed after .gitignore so its rules take precedence.
+            for path, key in own:
+                chain.insert(0, (self._load_ruleset(path, key), ''))
+            signature = signature + tuple(own)
+        return IgnoreContext(chain, signature)
+
+    def path_filter(self, root):
+        """Returns a predicate telling whether a file under root is ignored, checking every ancestor."""
+        root = os.path.abspath(root)
+        contexts = {}
+
+        def context_for(dir_path):
+            ctx = contexts.get(dir_path)
+            if ctx is not None:
+                return ctx
+            if dir_path == root:
+                parent, name = self.base_context(), None
+            else:
+                parent_path, name = os.path.split(dir_path)
+                parent = context_for(parent_path)
+                if parent is None or parent.ignored(name, True):
+                    contexts[dir_path] = None
+                    return None
+            present = {f for f in self.ignore_filenames if os.path.isfile(os.path.join(dir_path, f))}
+            ctx = self.child_context(parent, name, dir_path, present)
+            contexts[dir_path] = ctx
+            return ctx
+
+        def is_ignored(path):
+            path = os.path.abspath(path)
+            dir_path, name = os.path.split(path)
+            if dir_path != root and not dir_path.startswith(root + os.sep):
+                return self.base_ignored(name, os.path.isdir(path))
+            ctx = context_for(dir_path)
+            return ctx is None or ctx.ignored(name, os.path.isdir(path))
+
+        return is_ignored
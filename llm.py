@@ -1,85 +1,133 @@
 # llm.py
-from langchain_openai import ChatOpenAI, AzureChatOpenAI, OpenAIEmbeddings, AzureOpenAIEmbeddings
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.llms import Ollama
-from langchain.schema import HumanMessage
-from langchain.callbacks.base import BaseCallbackHandler
-import streamlit as st
-import requests
+import contextlib
+import functools
+import importlib
+import logging
+from telemetry import current_trace
+from client_registry import LeasedStream, fingerprint, get_client_registry
+from ollama_models import get_model_catalog
 
+logger = logging.getLogger(__name__)
 
-class StreamingCallbackHandler(BaseCallbackHandler):
-    """Callback handler for streaming to Streamlit."""
-    def __init__(self):
-        self.tokens = []
 
-    def on_llm_new_token(self, token: str, **kwargs):
-        """Stream output to a Streamlit app."""
-        return token
+def provider_class(module_name, class_name):
+    """Imports a provider SDK (or langchain) class on first use, so startup only loads the SDKs actually used."""
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+@functools.lru_cache(maxsize=None)
+def streaming_callback_handler_class():
+    """Defines StreamingCallbackHandler when the first client is created, as its base class imports langchain."""
+
+    class StreamingCallbackHandler(provider_class("langchain.callbacks.base", "BaseCallbackHandler")):
+        """Callback handler for streaming to Streamlit."""
+        def __init__(self):
+            self.tokens = []
+
+        def on_llm_new_token(self, token: str, **kwargs):
+            """Stream output to a Streamlit app."""
+            return token
+
+    return StreamingCallbackHandler
 
 
 class LLMHandler:
-    def openai_chat(self, prompt, openai_api_key, model_name="gpt-4o-mini"):
-        """Handle OpenAI chat completion with proper streaming."""
-        streaming_handler = StreamingCallbackHandler()
-        chat_openai = ChatOpenAI(
-            openai_api_key=openai_api_key,
-            model_name=model_name,
-            streaming=True,
-            callbacks=[streaming_handler]
+    """Creates provider clients through the shared ClientRegistry so they are reused across messages."""
+
+    def __init__(self, registry=None, model_catalog=None):
+        self.registry = registry or get_client_registry()
+        self.model_catalog = model_catalog or get_model_catalog()
+
+    def _chat_stream(self, key, factory, prompt, asynchronous):
+        """Streams prompt through the registry's chat client for key, which stays checked out until the stream is over.
+
+        Getting the client is timed as the client_setup stage of the current request.
+        """
+        trace = current_trace()
+        with trace.stage("client_setup") if trace is not None else contextlib.nullcontext():
+            client = self.registry.get(key, factory, checkout=True)
+        try:
+            stream = client.astream(prompt) if asynchronous else client.stream(prompt)
+        except BaseException:
+            self.registry.release(key)
+            raise
+        return LeasedStream(self.registry, key, stream)
+
+    def openai_chat(self, prompt, openai_api_key, model_name="gpt-4o-mini", asynchronous=False):
+        """Handle OpenAI chat completion with proper streaming; asynchronous=True returns an async iterator."""
+        return self._chat_stream(
+            ("OpenAI", "chat", fingerprint(openai_api_key), model_name),
+            lambda: provider_class("langchain_openai", "ChatOpenAI")(
+                openai_api_key=openai_api_key,
+                model_name=model_name,
+                streaming=True,
+                callbacks=[streaming_callback_handler_class()()]
+            ),
+            prompt, asynchronous
         )
-        return chat_openai.stream(prompt)
-
-    def azure_openai_chat(self, prompt, azure_openai_api_key, azure_openai_endpoint, azure_openai_deployment_name_chat, azure_openai_api_version, model_name="gpt-4o-mini"):
-        """Handle Azure OpenAI chat completion with proper streaming."""
-        streaming_handler = StreamingCallbackHandler()
-        # print(azure_openai_deployment_name_chat)
-        azure_chat_openai = AzureChatOpenAI(
-            api_key=azure_openai_api_key,
-            azure_endpoint=azure_openai_endpoint,
-            deployment_name=azure_openai_deployment_name_chat,
-            api_version=azure_openai_api_version,
-            streaming=True,
-            callbacks=[streaming_handler]
+
+    def azure_openai_chat(self, prompt, azure_openai_api_key, azure_openai_endpoint, azure_openai_deployment_name_chat, azure_openai_api_version, model_name="gpt-4o-mini", asynchronous=False):
+        """Handle Azure OpenAI chat completion with proper streaming; asynchronous=True returns an async iterator."""
+        return self._chat_stream(
+            ("Azure OpenAI", "chat", fingerprint(azure_openai_api_key), azure_openai_endpoint, azure_openai_deployment_name_chat, azure_openai_api_version),
+            lambda: provider_class("langchain_openai", "AzureChatOpenAI")(
+                api_key=azure_openai_api_key,
+                azure_endpoint=azure_openai_endpoint,
+                deployment_name=azure_openai_deployment_name_chat,
+                api_version=azure_openai_api_version,
+                streaming=True,
+                callbacks=[streaming_callback_handler_class()()]
+            ),
+            prompt, asynchronous
         )
-        return azure_chat_openai.stream(prompt)
 
     
-    def ollama_chat(self, prompt, ollama_base_url, model_name="llama2"):
-        """Handle Ollama chat completion with proper streaming."""
-        streaming_handler = StreamingCallbackHandler()
-        ollama_llm = Ollama(  # Use Ollama class here
-            base_url=ollama_base_url,
-            model=model_name,  # Use 'model' instead of 'model_name' for Ollama class
-            callbacks=[streaming_handler]
+    def ollama_chat(self, prompt, ollama_base_url, model_name="llama2", asynchronous=False):
+        """Handle Ollama chat completion with proper streaming; asynchronous=True returns an async iterator."""
+        return self._chat_stream(
+            ("Ollama", "chat", ollama_base_url, model_name),
+            lambda: provider_class("langchain_community.llms", "Ollama")(  # Use Ollama class here
+                base_url=ollama_base_url,
+                model=model_name,  # Use 'model' instead of 'model_name' for Ollama class
+                callbacks=[streaming_callback_handler_class()()]
+            ),
+            prompt, asynchronous
         )
-        return ollama_llm.stream(prompt)
 
 
     def openai_embeddings(self, openai_api_key, model_name="text-embedding-ada-002"):
-        return OpenAIEmbeddings(openai_api_key=openai_api_key, model_name=model_name)
+        return self.registry.get(
+            ("OpenAI", "embeddings", fingerprint(openai_api_key), model_name),
+            lambda: provider_class("langchain_openai", "OpenAIEmbeddings")(openai_api_key=openai_api_key, model=model_name)
+        )
 
     def azure_openai_embeddings(self, azure_openai_api_key, azure_openai_endpoint, azure_openai_deployment_name_embedding, azure_openai_api_version, model_name="text-embedding-ada-002"):
-        return AzureOpenAIEmbeddings(
-            api_key=azure_openai_api_key,
-            azure_endpoint=azure_openai_endpoint,
-            deployment_name=azure_openai_deployment_name_embedding,
-            api_version=azure_openai_api_version
+        return self.registry.get(
+            ("Azure OpenAI", "embeddings", fingerprint(azure_openai_api_key), azure_openai_endpoint, azure_openai_deployment_name_embedding, azure_openai_api_version),
+            lambda: provider_class("langchain_openai", "AzureOpenAIEmbeddings")(
+                api_key=azure_openai_api_key,
+                azure_endpoint=azure_openai_endpoint,
+                azure_deployment=azure_openai_deployment_name_embedding,
+                api_version=azure_openai_api_version
+            )
         )
 
     def ollama_embeddings(self, ollama_base_url, model_name="llama2"):
-        return OllamaEmbeddings(base_url=ollama_base_url, model_name=model_name)
+        return self.registry.get(
+            ("Ollama", "embeddings", ollama_base_url, model_name),
+            lambda: provider_class("langchain_community.embeddings", "OllamaEmbeddings")(base_url=ollama_base_url, model=model_name)
+        )
+
+    def ollama_models(self, ollama_base_url):
+        """Installed Ollama models with size, family and quantization, from the cached catalog.
+
+        Returns {"models", "error", "age", "refreshing"}; see OllamaModelCatalog.
+        """
+        return self.model_catalog.get(ollama_base_url)
 
     def list_ollama_models(self, ollama_base_url):
         """List available Ollama models."""
-        try:
-            response = requests.get(f"{ollama_base_url}/api/tags")
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                return [model["name"] for model in models]
-            else:
-                st.error(f"Failed to fetch Ollama models: {response.status_code}")
-                return []
-        except Exception as e:
-            st.error(f"Error fetching Ollama models: {e}")
-            return []
\ No newline at end of file
+        result = self.ollama_models(ollama_base_url)
+        if result["error"] and not result["models"]:
+            logger.error(f"Error fetching Ollama models: {result['error']}")
+        return [model["name"] for model in result["models"]]
@@ -1,95 +1,378 @@
 # llm_chain.py
-import streamlit as st
+import logging
 import os
-from prompts import create_prompt_templates
-from llm import LLMHandler
-from langchain.prompts import ChatPromptTemplate
+import contextlib
+import functools
+from prompts import create_prompt_templates, create_stable_prefix_templates
+from llm import LLMHandler, provider_class
+from context_packer import TokenCounter, pack_context, parse_context_text, resolve_token_budget
+from vector_index import (DEFAULT_TOP_K, EMBED_BATCH_SIZE, EMBED_BATCH_SIZES, VectorIndex,
+                          format_retrieved_chunks, load_shared_index)
+from embedding_cache import get_shared_embedding_cache
+from chat_history import format_message, resolve_history_budget
+from telemetry import RequestTrace, current_trace, get_telemetry_log
+from context_store import get_context_store
+from response_cache import areplay, get_shared_response_cache, replay, response_key
+from provider_router import DEFAULT_BACKOFF_SECONDS, ProviderRouter
+
+PROVIDERS = ("OpenAI", "Azure OpenAI", "Ollama")
+# Built by prompts.py on first use, which is when langchain gets imported.
+PROMPT_TEMPLATE_NAMES = ("system_prompt_template", "human_prompt_template", "followup_human_prompt_template",
+                         "retrieval_followup_human_prompt_template", "context_prompt_template",
+                         "retrieval_user_prompt_template")
+logger = logging.getLogger(__name__)
+
+
+def model_label(llm_provider, llm_config):
+    """Name of the chat model a request goes to, for telemetry."""
+    if llm_provider == "OpenAI":
+        return "gpt-4o-mini"
+    elif llm_provider == "Azure OpenAI":
+        return llm_config.get("azure_openai_deployment_name_chat")
+    elif llm_provider == "Ollama":
+        return llm_config.get("ollama_model_name_chat")
+    return None
 
 
 class LLMChainWrapper:
-    def __init__(self, llm_handler: LLMHandler):
+    def __init__(self, llm_handler: LLMHandler, telemetry_log=None, context_dir=None, response_cache=None, session_id=None,
+                 provider_slot=None):
         self.llm_handler = llm_handler
-        self.system_prompt_template, self.human_prompt_template, self.followup_human_prompt_template = create_prompt_templates()
+        # Async context manager factory limiting concurrent streams per provider; taken by fallback attempts.
+        self.provider_slot = provider_slot
+        self._response_cache = response_cache
+        # With a session_id, goal and code come from the in-memory context store
+        # and the vector index lives in the session's own directory.
+        self.session_id = session_id
+        if context_dir is None:
+            context_dir = get_context_store().session_dir(session_id) if session_id is not None else 'context'
+        self.context_dir = context_dir
+        self.index_dir = os.path.join(context_dir, 'vector_index')
+        self.telemetry_log = telemetry_log or get_telemetry_log()
         self.chat_history = [] #  No longer needed here, app.py session state is used
+        self.last_prompt_stats = None
+
+    def __getattr__(self, name):
+        """Resolves the prompt templates on first access, so importing this module does not load langchain."""
+        if name not in PROMPT_TEMPLATE_NAMES:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        templates = dict(zip(PROMPT_TEMPLATE_NAMES, create_prompt_templates() + create_stable_prefix_templates()))
+        self.__dict__.update(templates)
+        return templates[name]
 
     def load_context_files(self):
-        """Loads goal.txt and code.txt from the context folder."""
+        """Loads goal.txt and code.txt from the context folder, or the session's goal and code from the context store."""
         goal_content = ""
         code_context = ""
 
-        goal_file_path = os.path.join('context', 'goal.txt')
-        code_file_path = os.path.join('context', 'code.txt')
+        if self.session_id is not None:
+            store = get_context_store()
+            goal_content = store.get(self.session_id, "goal")
+            code_context = store.get(self.session_id, "code")
+            if goal_content is None:
+                goal_content = "No project goal set."
+            if code_context is None:
+                logger.warning("No code context saved for this session.")
+                code_context = "No code context provided."
+            return goal_content, code_context
+
+        goal_file_path = os.path.join(self.context_dir, 'goal.txt')
+        code_file_path = os.path.join(self.context_dir, 'code.txt')
 
         try:
             with open(goal_file_path, 'r', encoding='utf-8') as f:
                 goal_content = f.read()
         except FileNotFoundError:
-            st.warning("goal.txt not found in context folder.")
+            logger.warning("goal.txt not found in context folder.")
             goal_content = "No project goal set."
         except Exception as e:
-            st.error(f"Error reading goal.txt: {e}")
+            logger.error(f"Error reading goal.txt: {e}")
             goal_content = "Error loading project goal."
 
         try:
             with open(code_file_path, 'r', encoding='utf-8') as f:
                 code_context = f.read()
         except FileNotFoundError:
-            st.warning("code.txt not found in context folder.")
+            logger.warning("code.txt not found in context folder.")
             code_context = "No code context provided."
         except Exception as e:
-            st.error(f"Error reading code.txt: {e}")
+            logger.error(f"Error reading code.txt: {e}")
             code_context = "Error loading code context."
 
         return goal_content, code_context
 
-    def get_initial_llm_response(self, user_message, llm_provider, llm_config):
-        """Gets the LLM response for the first user message, including context."""
-        goal_content, code_context = self.load_context_files()
+    @property
+    def response_cache(self):
+        """The ResponseCache used when `response_cache_enabled` is set; opened on first use."""
+        if self._response_cache is None:
+            self._response_cache = get_shared_response_cache()
+        return self._response_cache
 
-        prompt = ChatPromptTemplate.from_messages([
-            self.system_prompt_template,
-            self.human_prompt_template
-        ])
+    @contextlib.contextmanager
+    def traced_request(self, llm_provider, llm_config, kind):
+        """Starts a RequestTrace for one chat request; it is written when the response stream ends."""
+        trace = RequestTrace(self.telemetry_log, llm_provider, model_label(llm_provider, llm_config), kind)
+        with trace.activate():
+            try:
+                yield trace
+            except Exception as e:
+                trace.finish(error=e)
+                raise
 
-        formatted_prompt = prompt.format_messages(
-            goal_content=goal_content,
-            code_context=code_context,
-            user_message=user_message
-        )
+    def stream_chat(self, formatted_prompt, llm_provider, llm_config, prompt_tokens=None, asynchronous=False):
+        """Sends formatted messages to the selected provider and returns its stream (an async iterator if asynchronous).
 
+        With `response_cache_enabled`, a response cached for the same provider,
+        model and messages is replayed through the same stream interface, and a
+        completed live response is stored for next time. With a
+        `fallback_llm_provider`, `hedge_after_seconds` or `provider_retries`, the
+        request goes through ProviderRouter, and the trace records which
+        provider answered.
+        """
+        trace = current_trace()
+        if trace is not None:
+            trace.set_prompt(formatted_prompt, prompt_tokens)
+        cache_key = None
+        if llm_config.get("response_cache_enabled"):
+            model = model_label(llm_provider, llm_config)
+            cache_key = response_key(llm_provider, model, formatted_prompt)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                if trace is None:
+                    return areplay(cached) if asynchronous else replay(cached)
+                trace.record["cache_hit"] = True
+                return trace.wrap_async_stream(areplay(cached)) if asynchronous else trace.wrap_stream(replay(cached))
+        candidates = self.route_candidates(formatted_prompt, llm_provider, llm_config, asynchronous)
+        if candidates is None:
+            if trace is not None:
+                trace.finish(error="LLM Provider not selected or supported.")
+            return "LLM Provider not selected or supported."
+        report = None
+        if len(candidates) == 1 and not llm_config.get("provider_retries"):
+            stream = candidates[0][1]()
+        else:
+            router = ProviderRouter(llm_config.get("hedge_after_seconds"), llm_config.get("provider_retries") or 0,
+                                    llm_config.get("retry_backoff_seconds") or DEFAULT_BACKOFF_SECONDS,
+                                    slot=self.provider_slot)
+            report = {}
+            if trace is not None:
+                trace.record["routing"] = report
+            stream = router.astream(candidates, report) if asynchronous else router.stream(candidates, report)
+        if cache_key is not None:
+            record = self.response_cache.arecord if asynchronous else self.response_cache.record
+            answered_by = None
+            if report is not None:
+                def answered_by():
+                    # Store a fallback's answer under the fallback's own key and model.
+                    provider = report.get("provider") or llm_provider
+                    provider_model = model_label(provider, llm_config)
+                    return response_key(provider, provider_model, formatted_prompt), provider, provider_model
+            stream = record(stream, cache_key, llm_provider, model, answered_by)
+        if trace is None:
+            return stream
+        return trace.wrap_async_stream(stream) if asynchronous else trace.wrap_stream(stream)
+
+    def provider_stream(self, formatted_prompt, llm_provider, llm_config, asynchronous=False):
+        """Starts a chat stream on one provider, or returns None if the provider is not supported."""
         if llm_provider == "OpenAI":
-            return self.llm_handler.openai_chat(formatted_prompt, llm_config["openai_api_key"])
+            return self.llm_handler.openai_chat(formatted_prompt, llm_config["openai_api_key"], asynchronous=asynchronous)
         elif llm_provider == "Azure OpenAI":
-            return self.llm_handler.azure_openai_chat(formatted_prompt, llm_config["azure_openai_api_key"], llm_config["azure_openai_endpoint"], llm_config["azure_openai_deployment_name_chat"], llm_config["azure_openai_api_version"])
+            return self.llm_handler.azure_openai_chat(formatted_prompt, llm_config["azure_openai_api_key"], llm_config["azure_openai_endpoint"], llm_config["azure_openai_deployment_name_chat"], llm_config["azure_openai_api_version"], asynchronous=asynchronous)
         elif llm_provider == "Ollama":
-            return self.llm_handler.ollama_chat(formatted_prompt, llm_config["ollama_base_url"], llm_config["ollama_model_name_chat"])
-        else:
-            return "LLM Provider not selected or supported."
+            return self.llm_handler.ollama_chat(formatted_prompt, llm_config["ollama_base_url"], llm_config["ollama_model_name_chat"], asynchronous=asynchronous)
+        return None
 
-    def get_followup_llm_response(self, user_message, llm_provider, llm_config, chat_history):
-        """Gets LLM response for subsequent messages, including chat history but not code context."""
+    def route_candidates(self, formatted_prompt, llm_provider, llm_config, asynchronous=False):
+        """(provider, stream factory) pairs to try: the selected provider, then `fallback_llm_provider` if set."""
+        if llm_provider not in PROVIDERS:
+            return None
+        providers = [llm_provider]
+        fallback = llm_config.get("fallback_llm_provider")
+        if fallback in PROVIDERS and fallback != llm_provider:
+            providers.append(fallback)
+        return [(provider, functools.partial(self.provider_stream, formatted_prompt, provider, llm_config, asynchronous))
+                for provider in providers]
 
-        # Format chat history into a readable string
-        formatted_history = ""
-        if chat_history:
-            for message in chat_history:
-                formatted_history += f"{message['role'].capitalize()}: {message['content']}\n\n"
+    def get_embeddings(self, llm_provider, llm_config):
+        """Returns (embeddings, model_id) for the selected provider, or (None, None)."""
+        if llm_provider == "OpenAI":
+            return self.llm_handler.openai_embeddings(llm_config["openai_api_key"]), "OpenAI:text-embedding-ada-002"
+        elif llm_provider == "Azure OpenAI":
+            deployment = llm_config["azure_openai_deployment_name_embedding"]
+            return self.llm_handler.azure_openai_embeddings(llm_config["azure_openai_api_key"], llm_config["azure_openai_endpoint"], deployment, llm_config["azure_openai_api_version"]), f"Azure OpenAI:{deployment}"
+        elif llm_provider == "Ollama":
+            model_name = llm_config["ollama_model_name_embedding"]
+            return self.llm_handler.ollama_embeddings(llm_config["ollama_base_url"], model_name), f"Ollama:{model_name}"
+        return None, None
 
-        prompt = ChatPromptTemplate.from_messages([
-            self.system_prompt_template, # System prompt is still relevant
-            self.followup_human_prompt_template # Use follow-up template with history
-        ])
+    def build_vector_index(self, file_contents, llm_provider, llm_config):
+        """Chunks and embeds the selected files and saves the vector index.
 
-        formatted_prompt = prompt.format_messages(
-            user_message=user_message,
-            chat_history=formatted_history # Include formatted chat history
+        Only chunks missing from the embedding cache are sent to the provider.
+        Returns the build stats (chunk count, cache hit rate, embedding calls saved).
+        """
+        embeddings, model_id = self.get_embeddings(llm_provider, llm_config)
+        if embeddings is None:
+            raise ValueError("LLM Provider not selected or supported.")
+        index = VectorIndex.build(
+            file_contents, embeddings, model_id,
+            batch_size=EMBED_BATCH_SIZES.get(llm_provider, EMBED_BATCH_SIZE),
+            cache=get_shared_embedding_cache(),
         )
+        index.save(self.index_dir)
+        return index.build_stats
 
-        if llm_provider == "OpenAI":
-            return self.llm_handler.openai_chat(formatted_prompt, llm_config["openai_api_key"])
-        elif llm_provider == "Azure OpenAI":
-            return self.llm_handler.azure_openai_chat(formatted_prompt, llm_config["azure_openai_api_key"], llm_config["azure_openai_endpoint"], llm_config["azure_openai_deployment_name_chat"], llm_config["azure_openai_api_version"])
-        elif llm_provider == "Ollama":
-            return self.llm_handler.ollama_chat(formatted_prompt, llm_config["ollama_base_url"], llm_config["ollama_model_name_chat"])
-        else:
-            return "LLM Provider not selected or supported."
\ No newline at end of file
+    def retrieve_code_context(self, user_message, llm_provider, llm_config):
+        """Returns the chunks most similar to user_message from the saved index, or None if unavailable."""
+        index = load_shared_index(self.index_dir)
+        if index is None:
+            logger.warning("No vector index found. Save the context with vectorization enabled to build one.")
+            return None
+        embeddings, model_id = self.get_embeddings(llm_provider, llm_config)
+        if model_id != index.model_id:
+            logger.warning(f"Vector index was built with {index.model_id}; save the context again to use {model_id}.")
+            return None
+        results = index.query(embeddings, user_message, llm_config.get("vector_top_k") or DEFAULT_TOP_K)
+        return format_retrieved_chunks(results)
+
+    def get_stable_prefix_llm_response(self, user_message, llm_provider, llm_config, chat_history, prefix_state, history_manager=None, asynchronous=False):
+        """Gets the LLM response using the stable-prefix layout, for the first and every later turn.
+
+        The system prompt and a goal + code context message, packed once per chat
+        and kept in prefix_state, lead every request unchanged; history follows as
+        real user/assistant messages and retrieved chunks (with vectorization) go
+        into the final user message, so providers can reuse the cached prefix.
+        """
+        with self.traced_request(llm_provider, llm_config, "stable_prefix") as trace:
+            counter = TokenCounter(llm_provider)
+            history = chat_history or []
+            summary = ""
+            if history_manager is not None:
+                history_manager.configure(llm_provider, resolve_history_budget(llm_provider, llm_config.get("history_token_budget")))
+                summary, history = history_manager.split(history)
+                if history_manager.pinned_updates:
+                    # A context update left the window: re-pack the saved context, which
+                    # already includes it, rather than summarizing the diff away.
+                    history_manager.drop_pinned_updates()
+                    prefix_state.context_messages = None
+            if prefix_state.context_messages is None:
+                with trace.stage("load_context"):
+                    goal_content, code_context = self.load_context_files()
+                budget = resolve_token_budget(llm_provider, llm_config.get("context_token_budget"))
+                with trace.stage("pack_context"):
+                    goal_content, code_context, prefix_state.context_stats = pack_context(
+                        goal_content, code_context, user_message, counter, budget, llm_config.get("project_path")
+                    )
+                prefix_state.context_messages = [
+                    self.system_prompt_template.format(),
+                    self.context_prompt_template.format(goal_content=goal_content, code_context=code_context),
+                ]
+                prefix_state.context_as_of = len(chat_history or [])
+
+            AIMessage = provider_class("langchain.schema", "AIMessage")
+            HumanMessage = provider_class("langchain.schema", "HumanMessage")
+            messages = list(prefix_state.context_messages)
+            if summary:
+                messages.append(HumanMessage(content=summary.rstrip("\n")))
+            first_index = len(chat_history or []) - len(history)
+            for index, message in enumerate(history, first_index):
+                if message.get("kind") == "context_update" and index < prefix_state.context_as_of:
+                    continue  # already part of the packed context
+                message_class = AIMessage if message["role"] == "assistant" else HumanMessage
+                messages.append(message_class(content=message["content"]))
+
+            retrieved = None
+            if llm_config.get("vectorization_enabled"):
+                with trace.stage("retrieval"):
+                    retrieved = self.retrieve_code_context(user_message, llm_provider, llm_config)
+            if retrieved is not None:
+                messages.append(self.retrieval_user_prompt_template.format(code_context=retrieved, user_message=user_message))
+            else:
+                messages.append(HumanMessage(content=user_message))
+
+            prompt_stats = dict(prefix_state.context_stats)
+            prompt_stats.update(prefix_state.record(messages, counter))
+            self.last_prompt_stats = prompt_stats
+
+            return self.stream_chat(messages, llm_provider, llm_config, prompt_stats["prompt_tokens"], asynchronous)
+
+    def get_initial_llm_response(self, user_message, llm_provider, llm_config, asynchronous=False):
+        """Gets the LLM response for the first user message, including context packed into the token budget."""
+        with self.traced_request(llm_provider, llm_config, "initial") as trace:
+            with trace.stage("load_context"):
+                goal_content, code_context = self.load_context_files()
+
+            if llm_config.get("vectorization_enabled"):
+                with trace.stage("retrieval"):
+                    retrieved = self.retrieve_code_context(user_message, llm_provider, llm_config)
+                if retrieved is not None:
+                    parsed = parse_context_text(code_context)
+                    tree_str = parsed[0] if parsed else ""
+                    code_context = f"Folder Tree Structure:\n{tree_str}\n\nRelevant Code Chunks:\n{retrieved}"
+
+            counter = TokenCounter(llm_provider)
+            budget = resolve_token_budget(llm_provider, llm_config.get("context_token_budget"))
+            with trace.stage("pack_context"):
+                goal_content, code_context, prompt_stats = pack_context(
+                    goal_content, code_context, user_message, counter, budget, llm_config.get("project_path")
+                )
+
+            prompt = provider_class("langchain.prompts", "ChatPromptTemplate").from_messages([
+                self.system_prompt_template,
+                self.human_prompt_template
+            ])
+
+            formatted_prompt = prompt.format_messages(
+                goal_content=goal_content,
+                code_context=code_context,
+                user_message=user_message
+            )
+            prompt_stats["prompt_tokens"] = sum(counter.count(message.content) for message in formatted_prompt)
+            self.last_prompt_stats = prompt_stats
+
+            return self.stream_chat(formatted_prompt, llm_provider, llm_config, prompt_stats["prompt_tokens"], asynchronous)
+
+    def get_followup_llm_response(self, user_message, llm_provider, llm_config, chat_history, history_manager=None, asynchronous=False):
+        """Gets LLM response for subsequent messages, including chat history and, with vectorization, retrieved code.
+
+        With a ChatHistoryManager the history is windowed to the provider's history
+        token budget, older turns being folded into a rolling summary.
+        """
+        with self.traced_request(llm_provider, llm_config, "followup") as trace:
+
+            # Format chat history into a readable string
+            with trace.stage("format_history"):
+                if history_manager is not None:
+                    history_manager.configure(llm_provider, resolve_history_budget(llm_provider, llm_config.get("history_token_budget")))
+                    formatted_history = history_manager.format(chat_history or [])
+                else:
+                    formatted_history = "".join(format_message(message) for message in chat_history or [])
+
+            retrieved = None
+            if llm_config.get("vectorization_enabled"):
+                with trace.stage("retrieval"):
+                    retrieved = self.retrieve_code_context(user_message, llm_provider, llm_config)
+
+            ChatPromptTemplate = provider_class("langchain.prompts", "ChatPromptTemplate")
+            if retrieved is not None:
+                prompt = ChatPromptTemplate.from_messages([
+                    self.system_prompt_template,
+                    self.retrieval_followup_human_prompt_template # Follow-up template with retrieved chunks
+                ])
+                formatted_prompt = prompt.format_messages(
+                    user_message=user_message,
+                    chat_history=formatted_history,
+                    code_context=retrieved
+                )
+            else:
+                prompt = ChatPromptTemplate.from_messages([
+                    self.system_prompt_template, # System prompt is still relevant
+                    self.followup_human_prompt_template # Use follow-up template with history
+                ])
+
+                formatted_prompt = prompt.format_messages(
+                    user_message=user_message,
+                    chat_history=formatted_history # Include formatted chat history
+                )
+
+            return self.stream_chat(formatted_prompt, llm_provider, llm_config, asynchronous=asynchronous)
\ No newline at end of file
@@ -0,0 +1,119 @@
+# ollama_models.py
+import threading
+import time
+
+from client_registry import get_http_session
+
+# (connect, read) timeouts for /api/tags; a slow or down host must not block the sidebar.
+DISCOVERY_TIMEOUT = (1.5, 4)
+MODELS_TTL_SECONDS = 60
+ERROR_TTL_SECONDS = 10
+
+
+def parse_tags(payload):
+    """Turns an /api/tags response into model dicts with name, size and details."""
+    models = []
+    for model in payload.get("models", []):
+        details = model.get("details") or {}
+        models.append({
+            "name": model["name"],
+            "size_bytes": model.get("size"),
+            "family": details.get("family"),
+            "parameter_size": details.get("parameter_size"),
+            "quantization": details.get("quantization_level"),
+            "modified_at": model.get("modified_at"),
+        })
+    return models
+
+
+def format_model_label(model):
+    """Selectbox label such as 'llama3:8b · 4.7 GB · llama · 8.0B · Q4_0'."""
+    parts = [model["name"]]
+    if model.get("size_bytes"):
+        parts.append(f"{model['size_bytes'] / 1e9:.1f} GB")
+    parts.extend(model[key] for key in ("family", "parameter_size", "quantization") if model.get(key))
+    return " · ".join(parts)
+
+
+def fetch_models(base_url, timeout=DISCOVERY_TIMEOUT):
+    """Fetches the installed models from an Ollama server; raises on HTTP or connection errors."""
+    response = get_http_session().get(f"{base_url.rstrip('/')}/api/tags", timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return parse_tags(response.json())
+
+
+class OllamaModelCatalog:
+    """Model lists per Ollama base URL, cached with stale-while-revalidate.
+
+    A fresh list (younger than ttl) is returned as is. A stale list is
+    returned immediately while one background thread per URL fetches a new
+    one. Only the very first lookup of a URL waits for the server, bounded by
+    the discovery timeout; failures are remembered for ERROR_TTL_SECONDS so a
+    down host is not retried on every rerun.
+    """
+
+    def __init__(self, ttl=MODELS_TTL_SECONDS, error_ttl=ERROR_TTL_SECONDS, fetch=fetch_models, clock=time.monotonic):
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.fetch = fetch
+        self.clock = clock
+        self._entries = {}  # base_url -> {"models", "error", "fetched_at", "checked_at"}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, base_url):
+        """Returns {"models", "error", "age", "refreshing"} for base_url; age is None until a fetch succeeds."""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(base_url)
+            if entry is not None:
+                ttl = self.error_ttl if entry["error"] and not entry["models"] else self.ttl
+                if now - entry["checked_at"] > ttl and base_url not in self._refreshing:
+                    self._refreshing.add(base_url)
+                    threading.Thread(target=self._refresh, args=(base_url,), daemon=True).start()
+                return self._view(entry, now, base_url in self._refreshing)
+        self._refresh(base_url)
+        with self._lock:
+            return self._view(self._entries[base_url], self.clock(), False)
+
+    def _refresh(self, base_url):
+        try:
+            models, error = self.fetch(base_url), None
+        except Exception as e:
+            models, error = None, str(e)
+        now = self.clock()
+        with self._lock:
+            previous = self._entries.get(base_url)
+            if models is not None:
+                entry = {"models": models, "error": None, "fetched_at": now, "checked_at": now}
+            elif previous is not None and previous["fetched_at"] is not None:
+                # Keep serving the last good list, aged from when it was fetched.
+                entry = dict(previous, error=error, checked_at=now)
+            else:
+                entry = {"models": [], "error": error, "fetched_at": None, "checked_at": now}
+            self._entries[base_url] = entry
+            self._refreshing.discard(base_url)
+
+    @staticmethod
+    def _view(entry, now, refreshing):
+        return {
+            "models": entry["models"],
+            "error": entry["error"],
+            "age": None if entry["fetched_at"] is None else now - entry["fetched_at"],
+            "refreshing": refreshing,
+        }
+
+    def invalidate(self, base_url=None):
+        with self._lock:
+            if base_url is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(base_url, None)
+
+
+_catalog = OllamaModelCatalog()
+
+
+def get_model_catalog():
+    return _catalog
@@ -0,0 +1,49 @@
+# prompt_prefix.py
+import hashlib
+
+
+def _digest(message):
+    return hashlib.sha256(f"{message.type}\0{message.content}".encode('utf-8')).hexdigest()
+
+
+class PromptPrefixState:
+    """Per-session state for the stable-prefix message layout.
+
+    Holds the goal/code context packed on the first turn so that the leading
+    messages are byte-identical on later turns (it is re-packed only when a
+    context update would otherwise be summarized away), and remembers the
+    previous turn's messages to measure how much of the prompt was an exact
+    prefix repeat (what provider prompt caches and Ollama's KV cache can reuse).
+    """
+
+    def __init__(self):
+        self.context_messages = None
+        self.context_stats = None
+        self.context_as_of = 0  # history length when the context was packed; earlier context updates are in it
+        self._previous = []  # (digest, tokens) per message of the previous turn
+        self.last_stats = None
+
+    def record(self, messages, counter):
+        """Compares messages with the previous turn and returns prefix-reuse stats."""
+        current = []
+        reused_tokens = 0
+        reused_messages = 0
+        matching = True
+        for i, message in enumerate(messages):
+            digest = _digest(message)
+            if matching and i < len(self._previous) and self._previous[i][0] == digest:
+                tokens = self._previous[i][1]
+                reused_tokens += tokens
+                reused_messages += 1
+            else:
+                matching = False
+                tokens = counter.count(message.content)
+            current.append((digest, tokens))
+        self._previous = current
+        self.last_stats = {
+            "prompt_tokens": sum(tokens for _, tokens in current),
+            "prefix_tokens_reused": reused_tokens,
+            "prefix_messages_reused": reused_messages,
+            "exact_tokens": counter.exact,
+        }
+        return self.last_stats
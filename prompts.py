@@ -1,8 +1,11 @@
 # prompts.py
-from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
+import functools
 
+
+@functools.lru_cache(maxsize=None)
 def create_prompt_templates():
-    """Creates and returns system and human prompt templates."""
+    """Creates and returns system and human prompt templates; langchain is imported on the first call."""
+    from langchain.prompts import SystemMessagePromptTemplate, HumanMessagePromptTemplate
 
     system_prompt_template = SystemMessagePromptTemplate.from_template(
         "You are a helpful AI code assistant. Your role is to assist the user with their coding tasks based on the project context and their goals. "
@@ -21,4 +24,28 @@ def create_prompt_templates():
         "User Message: {user_message}"
     )
 
-    return system_prompt_template, human_prompt_template, followup_human_prompt_template
\ No newline at end of file
+    retrieval_followup_human_prompt_template = HumanMessagePromptTemplate.from_template(
+        "Relevant Code Context:\n{code_context}\n\n" # Chunks retrieved from the vector index for this message
+        "Chat History:\n{chat_history}\n\n"
+        "User Message: {user_message}"
+    )
+
+    return system_prompt_template, human_prompt_template, followup_human_prompt_template, retrieval_followup_human_prompt_template
+
+
+@functools.lru_cache(maxsize=None)
+def create_stable_prefix_templates():
+    """Creates templates for the stable-prefix layout, where goal and code context form a fixed leading message."""
+    from langchain.prompts import HumanMessagePromptTemplate
+
+    context_prompt_template = HumanMessagePromptTemplate.from_template(
+        "Project Goal:\n{goal_content}\n\n"
+        "Project Code Context:\n{code_context}"
+    )
+
+    retrieval_user_prompt_template = HumanMessagePromptTemplate.from_template(
+        "Relevant Code Context:\n{code_context}\n\n"
+        "User Message: {user_message}"
+    )
+
+    return context_prompt_template, retrieval_user_prompt_template
\ No newline at end of file
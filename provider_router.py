@@ -0,0 +1,266 @@
+# provider_router.py
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+
+DEFAULT_RETRIES = 0
+DEFAULT_BACKOFF_SECONDS = 0.5
+
+
+class _Attempt:
+    def __init__(self, index, llm_provider, number, started_at):
+        self.index = index
+        self.llm_provider = llm_provider
+        self.number = number
+        self.started_at = started_at
+        self.cancelled = threading.Event()
+        self.task = None
+        self.record = {"provider": llm_provider, "attempt": number, "outcome": "running",
+                       "first_token_seconds": None, "error": None}
+
+
+class _Routing:
+    """Decides which provider attempts run; shared by the thread and asyncio drivers.
+
+    Attempts start with the first candidate. Without a first token after
+    hedge_after seconds the next candidate is started alongside; the first
+    attempt to produce a token wins and the others are cancelled. An attempt
+    that fails before its first token is retried after an exponential backoff
+    up to `retries` times, and then the next candidate takes over. Errors
+    after the first token are not retried, as part of the answer is already out.
+    """
+
+    def __init__(self, candidates, hedge_after, retries, backoff, clock, report):
+        self.candidates = candidates
+        self.hedge_after = hedge_after
+        self.retries = retries
+        self.backoff = backoff
+        self.clock = clock
+        self.started_at = clock()
+        self.pending = list(range(len(candidates)))
+        self.failures = {}
+        self.scheduled = []  # (time, candidate index) retries waiting for their backoff
+        self.running = []
+        self.winner = None
+        self.last_error = None
+        self.report = report
+        report.update({"primary": candidates[0][0], "provider": None, "hedged": False,
+                       "failed_over": False, "retries": 0, "attempts": []})
+
+    def launch(self, index):
+        llm_provider = self.candidates[index][0]
+        attempt = _Attempt(index, llm_provider, self.failures.get(index, 0) + 1, self.clock())
+        if index in self.pending:
+            self.pending.remove(index)
+        self.running.append(attempt)
+        self.report["attempts"].append(attempt.record)
+        return attempt
+
+    def timeout(self):
+        """Seconds until the next hedge or retry is due, or None to wait for events only."""
+        if self.winner is not None:
+            return None
+        deadlines = [when for when, _ in self.scheduled]
+        if self.hedge_after and not self.report["hedged"] and self.pending:
+            deadlines.append(self.started_at + self.hedge_after)
+        return max(0.0, min(deadlines) - self.clock()) if deadlines else None
+
+    def due(self):
+        """Candidate indexes to launch now: retries past their backoff, a hedge, or the next after a failure."""
+        if self.winner is not None:
+            return []
+        now = self.clock()
+        launches = [index for when, index in self.scheduled if when <= now]
+        self.scheduled = [(when, index) for when, index in self.scheduled if when > now]
+        if self.hedge_after and not self.report["hedged"] and self.pending and now >= self.started_at + self.hedge_after:
+            self.report["hedged"] = True
+            launches.append(self.pending[0])
+        if not launches and not self.running and not self.scheduled and self.pending:
+            self.report["failed_over"] = True
+            launches.append(self.pending[0])
+        return launches
+
+    def exhausted(self):
+        return self.winner is None and not self.running and not self.scheduled and not self.pending
+
+    def on_chunk(self, attempt):
+        """Returns True if the chunk belongs to the winning attempt and should be passed on."""
+        if self.winner is None:
+            self.winner = attempt
+            attempt.record["outcome"] = "won"
+            attempt.record["first_token_seconds"] = self.clock() - attempt.started_at
+            self.report["provider"] = attempt.llm_provider
+            return True
+        return attempt is self.winner
+
+    def losers(self):
+        return [attempt for attempt in self.running if attempt is not self.winner]
+
+    def on_done(self, attempt):
+        """Returns True when the response is complete."""
+        if attempt in self.running:
+            self.running.remove(attempt)
+        if self.winner is None:
+            self.on_chunk(attempt)  # finished without output: still the answer
+        return attempt is self.winner
+
+    def on_error(self, attempt, error):
+        """Records a failed attempt; returns True if it had already won, so the error must propagate."""
+        if attempt in self.running:
+            self.running.remove(attempt)
+        attempt.record["outcome"] = "error"
+        attempt.record["error"] = f"{type(error).__name__}: {error}"
+        if attempt is self.winner:
+            return True
+        self.last_error = error
+        if self.winner is None:
+            failures = self.failures.get(attempt.index, 0) + 1
+            self.failures[attempt.index] = failures
+            if failures <= self.retries:
+                self.report["retries"] += 1
+                self.scheduled.append((self.clock() + self.backoff * 2 ** (failures - 1), attempt.index))
+        return False
+
+    def cancel_losers(self):
+        for attempt in self.losers():
+            attempt.record["outcome"] = "cancelled"
+            attempt.cancelled.set()
+            if attempt.task is not None:
+                attempt.task.cancel()
+        self.running = [self.winner] if self.winner in self.running else []
+
+
+def _pump(factory, attempt, events):
+    stream = None
+    try:
+        stream = factory()
+        for chunk in stream:
+            if attempt.cancelled.is_set():
+                return
+            events.put(("chunk", attempt, chunk))
+        events.put(("done", attempt, None))
+    except Exception as e:
+        events.put(("error", attempt, e))
+    finally:
+        close = getattr(stream, "close", None)
+        if attempt.cancelled.is_set() and callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+
+
+async def _apump(factory, attempt, events, slot=None):
+    try:
+        if slot is None:
+            async for chunk in factory():
+                await events.put(("chunk", attempt, chunk))
+        else:
+            async with slot(attempt.llm_provider):
+                async for chunk in factory():
+                    await events.put(("chunk", attempt, chunk))
+        await events.put(("done", attempt, None))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await events.put(("error", attempt, e))
+
+
+class ProviderRouter:
+    """Streams a chat response from the first of several providers to answer.
+
+    candidates is a list of (llm_provider, factory) pairs, primary first;
+    each factory returns that provider's stream. report (a dict) is filled
+    with the provider used, whether the request was hedged or failed over,
+    and every attempt's outcome, for the request's telemetry record.
+
+    slot, if given, is an async context manager factory taking a provider
+    name (such as ProviderLimiter.slot in api_server.py); astream() enters it
+    around every attempt on a provider other than the primary, whose slot the
+    caller already holds.
+    """
+
+    def __init__(self, hedge_after=None, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF_SECONDS, clock=time.monotonic, slot=None):
+        self.hedge_after = hedge_after
+        self.retries = retries
+        self.backoff = backoff
+        self.clock = clock
+        self.slot = slot
+
+    def stream(self, candidates, report):
+        """Sync generator; each attempt runs in a worker thread feeding a queue."""
+        routing = _Routing(candidates, self.hedge_after, self.retries, self.backoff, self.clock, report)
+        events = queue.Queue()
+
+        def launch(index):
+            attempt = routing.launch(index)
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(_pump, candidates[index][1], attempt, events), daemon=True).start()
+
+        launch(0)
+        try:
+            while True:
+                for index in routing.due():
+                    launch(index)
+                if routing.exhausted():
+                    raise routing.last_error
+                try:
+                    kind, attempt, payload = events.get(timeout=routing.timeout())
+                except queue.Empty:
+                    continue
+                if kind == "chunk":
+                    if routing.on_chunk(attempt):
+                        routing.cancel_losers()
+                        yield payload
+                elif kind == "done":
+                    if routing.on_done(attempt):
+                        routing.cancel_losers()
+                        return
+                elif routing.on_error(attempt, payload):
+                    raise payload
+        finally:
+            routing.winner = routing.winner or object()
+            routing.cancel_losers()
+            for attempt in routing.running:
+                attempt.cancelled.set()
+
+    async def astream(self, candidates, report):
+        """Async generator; each attempt runs as a task, and losing tasks are cancelled."""
+        routing = _Routing(candidates, self.hedge_after, self.retries, self.backoff, self.clock, report)
+        events = asyncio.Queue()
+
+        def launch(index):
+            attempt = routing.launch(index)
+            slot = self.slot if index > 0 else None
+            attempt.task = asyncio.ensure_future(_apump(candidates[index][1], attempt, events, slot))
+
+        launch(0)
+        try:
+            while True:
+                for index in routing.due():
+                    launch(index)
+                if routing.exhausted():
+                    raise routing.last_error
+                try:
+                    kind, attempt, payload = await asyncio.wait_for(events.get(), routing.timeout())
+                except asyncio.TimeoutError:
+                    continue
+                if kind == "chunk":
+                    if routing.on_chunk(attempt):
+                        routing.cancel_losers()
+                        yield payload
+                elif kind == "done":
+                    if routing.on_done(attempt):
+                        routing.cancel_losers()
+                        return
+                elif routing.on_error(attempt, payload):
+                    raise payload
+        finally:
+            routing.winner = routing.winner or object()
+            routing.cancel_losers()
+            for attempt in routing.running:
+                attempt.cancelled.set()
+                if attempt.task is not None:
+                    attempt.task.cancel()
@@ -0,0 +1,177 @@
+# response_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.path.join('context', 'response_cache.sqlite3')
+TTL_HOURS = 24
+MAX_MEGABYTES = 50
+REPLAY_CHUNK_CHARS = 24
+
+
+def response_key(llm_provider, model, messages):
+    """Hash of provider, model and the fully formatted messages (role and content of each)."""
+    payload = [llm_provider, model, [[type(message).__name__, message.content] for message in messages]]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _replay_pieces(text, chunk_chars=REPLAY_CHUNK_CHARS):
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        # Prefer to break after a space so replayed chunks look like streamed tokens.
+        space = text.rfind(" ", start, end)
+        if end < len(text) and space > start:
+            end = space + 1
+        yield text[start:end]
+        start = end
+
+
+def replay(text):
+    """Streams a cached response as string chunks, like a provider stream."""
+    yield from _replay_pieces(text)
+
+
+async def areplay(text):
+    for piece in _replay_pieces(text):
+        yield piece
+
+
+class ResponseCache:
+    """Completed chat responses on disk, keyed by response_key.
+
+    Opt-in with `response_cache_enabled`. Entries expire ttl_hours after they
+    were stored; when the stored text exceeds max_megabytes the least recently
+    used entries are removed. Only streams that ran to completion are stored.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl_hours=TTL_HOURS, max_megabytes=MAX_MEGABYTES):
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_bytes = int(max_megabytes * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+
+    def _connect(self):
+        """Opens the database on first use, so a disabled cache never creates the file. Call with the lock held."""
+        if self._conn is not None:
+            return self._conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " provider TEXT,"
+            " model TEXT,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        """Returns the cached response for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            self._connect()
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            elif row is not None:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, llm_provider, model, response):
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model, response, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, llm_provider, model, response, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def record(self, stream, key, llm_provider, model, answered_by=None):
+        """Yields from a provider stream and stores the full text once it completes.
+
+        answered_by, if given, is called at completion and returns the
+        (key, llm_provider, model) to store under, for streams that may have
+        been served by another provider.
+        """
+        parts = []
+        for chunk in stream:
+            content = getattr(chunk, "content", chunk)
+            if isinstance(content, str):
+                parts.append(content)
+            yield chunk
+        if parts:
+            if answered_by is not None:
+                key, llm_provider, model = answered_by()
+            self.put(key, llm_provider, model, "".join(parts))
+
+    async def arecord(self, stream, key, llm_provider, model, answered_by=None):
+        parts = []
+        async for chunk in stream:
+            content = getattr(chunk, "content", chunk)
+            if isinstance(content, str):
+                parts.append(content)
+            yield chunk
+        if parts:
+            if answered_by is not None:
+                key, llm_provider, model = answered_by()
+            self.put(key, llm_provider, model, "".join(parts))
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": entries, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_response_cache(path=CACHE_PATH, ttl_hours=TTL_HOURS, max_megabytes=MAX_MEGABYTES):
+    """Returns the process-wide cache for path; limits are taken from the first call."""
+    with _shared_lock:
+        cache = _shared.get(path)
+        if cache is None:
+            cache = ResponseCache(path, ttl_hours, max_megabytes)
+            _shared[path] = cache
+        return cache
@@ -0,0 +1,134 @@
+# session_log.py
+import json
+import os
+import re
+import struct
+import threading
+
+CHAT_LOG_DIR = os.path.join('context', 'chat_sessions')
+OFFSET = struct.Struct("<Q")
+SESSION_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def is_session_id(value):
+    """True for ids made by uuid4().hex, the only ones used as file names."""
+    return isinstance(value, str) and SESSION_ID_PATTERN.fullmatch(value) is not None
+
+
+class SessionLog:
+    """A chat session's messages, one JSON line each, in an append-only file.
+
+    Next to the log, an index file holds the byte offset of every message as
+    a fixed-width integer, so the message count and any range of messages
+    (such as the last N, for display) are read with one seek each, without
+    scanning the log. A record written without its index entry, or cut off
+    by a crash, is repaired when the log is opened.
+    """
+
+    def __init__(self, session_id, log_dir=CHAT_LOG_DIR):
+        if not is_session_id(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        self.session_id = session_id
+        self.path = os.path.join(log_dir, f"{session_id}.jsonl")
+        self.index_path = os.path.join(log_dir, f"{session_id}.idx")
+        self._lock = threading.Lock()
+        os.makedirs(log_dir, exist_ok=True)
+        for path in (self.path, self.index_path):
+            if not os.path.exists(path):
+                open(path, 'ab').close()
+        self._recover()
+
+    def _recover(self):
+        """Makes the index match the complete records in the log."""
+        log_size = os.path.getsize(self.path)
+        with open(self.index_path, 'r+b') as index:
+            count = os.path.getsize(self.index_path) // OFFSET.size
+            # Drop index entries past the end of the log, then re-index unindexed records.
+            while count and self._offset(index, count - 1) >= log_size:
+                count -= 1
+            index.truncate(count * OFFSET.size)
+            with open(self.path, 'r+b') as log:
+                position = 0
+                if count:
+                    position = self._offset(index, count - 1)
+                    log.seek(position)
+                    line = log.readline()
+                    if line.endswith(b"\n"):
+                        position += len(line)
+                    else:
+                        count -= 1
+                        index.truncate(count * OFFSET.size)
+                log.seek(position)
+                index.seek(count * OFFSET.size)
+                for line in iter(log.readline, b""):
+                    if not line.endswith(b"\n"):
+                        break
+                    index.write(OFFSET.pack(position))
+                    position += len(line)
+                log.truncate(position)  # a partial last record is dropped
+
+    @staticmethod
+    def _offset(index, position):
+        index.seek(position * OFFSET.size)
+        return OFFSET.unpack(index.read(OFFSET.size))[0]
+
+    def __len__(self):
+        with self._lock:
+            return os.path.getsize(self.index_path) // OFFSET.size
+
+    def append(self, message):
+        """Appends one message dict; the record is flushed before its index entry.
+
+        The offset is taken from the end of the file rather than a cached size,
+        so the index stays right whoever else has appended to the log.
+        """
+        line = (json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._lock:
+            with open(self.path, 'ab') as log:
+                log.seek(0, os.SEEK_END)
+                offset = log.tell()
+                log.write(line)
+            with open(self.index_path, 'ab') as index:
+                index.write(OFFSET.pack(offset))
+
+    def read(self, start=0, stop=None):
+        """Returns messages[start:stop] (non-negative bounds, clipped to the log)."""
+        with self._lock:
+            count = os.path.getsize(self.index_path) // OFFSET.size
+            stop = count if stop is None else min(stop, count)
+            start = max(0, start)
+            if start >= stop:
+                return []
+            with open(self.index_path, 'rb') as index:
+                begin = self._offset(index, start)
+                end = self._offset(index, stop) if stop < count else None
+            with open(self.path, 'rb') as log:
+                log.seek(begin)
+                data = log.read() if end is None else log.read(end - begin)
+        # Split the bytes, not the text: str.splitlines() also breaks on U+0085, U+2028 and U+2029,
+        # which json.dumps(ensure_ascii=False) leaves unescaped inside records.
+        return [json.loads(line) for line in data.split(b"\n") if line]
+
+    def tail(self, n):
+        """The last n messages."""
+        return self.read(max(0, len(self) - n))
+
+    def clear(self):
+        with self._lock:
+            for path in (self.path, self.index_path):
+                open(path, 'wb').close()
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_session_log(session_id, log_dir=CHAT_LOG_DIR):
+    """Returns the process-wide log for a session, so tabs sharing a session URL share one writer and lock."""
+    key = (os.path.abspath(log_dir), session_id)
+    with _logs_lock:
+        log = _logs.get(key)
+        if log is None:
+            log = SessionLog(session_id, log_dir)
+            _logs[key] = log
+        return log
@@ -0,0 +1,92 @@
+# stream_renderer.py
+import time
+
+FLUSH_INTERVAL_SECONDS = 0.08
+FLUSH_CHARS = 400
+CURSOR = "▌"
+
+
+class StreamRenderer:
+    """Buffers streamed chunks and re-renders a Streamlit placeholder at a bounded rate.
+
+    Chunks are collected in a list and the placeholder is only updated when
+    FLUSH_INTERVAL_SECONDS have passed or FLUSH_CHARS new characters arrived.
+    Both thresholds grow with the response length, so a long answer costs a
+    bounded number of re-renders instead of one per chunk. Also
+    records time to first token and throughput; each non-empty chunk counts as
+    one token, which matches how the supported providers stream.
+    """
+
+    def __init__(self, placeholder, flush_interval=FLUSH_INTERVAL_SECONDS, flush_chars=FLUSH_CHARS, clock=time.perf_counter):
+        self.placeholder = placeholder
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.clock = clock
+        self.parts = []
+        self.total_chars = 0
+        self.chunk_count = 0
+        self.flush_count = 0
+        self.started_at = clock()
+        self.first_token_at = None
+        self.finished_at = None
+        self._last_flush = self.started_at
+        self._pending_chars = 0
+
+    def add(self, content):
+        """Appends a chunk of text, re-rendering if the flush interval or size was reached."""
+        if not content:
+            return
+        now = self.clock()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.parts.append(content)
+        self.chunk_count += 1
+        self.total_chars += len(content)
+        self._pending_chars += len(content)
+        # Both thresholds grow with the text already shown, keeping total re-render work linear.
+        interval = self.flush_interval * (1 + self.total_chars / 20000)
+        size = max(self.flush_chars, self.total_chars // 8)
+        if self._pending_chars >= size or now - self._last_flush >= interval:
+            self._flush(now, CURSOR)
+
+    def _flush(self, now, suffix=""):
+        self.placeholder.markdown("".join(self.parts) + suffix)
+        self.flush_count += 1
+        self._last_flush = now
+        self._pending_chars = 0
+
+    def text(self):
+        return "".join(self.parts)
+
+    def finish(self):
+        """Renders the complete response without the cursor and returns it."""
+        self.finished_at = self.clock()
+        full_response = self.text()
+        if full_response:
+            self._flush(self.finished_at)
+        return full_response
+
+    @property
+    def stats(self):
+        end = self.finished_at if self.finished_at is not None else self.clock()
+        ttft = None if self.first_token_at is None else self.first_token_at - self.started_at
+        streaming = None if self.first_token_at is None else end - self.first_token_at
+        return {
+            "time_to_first_token": ttft,
+            "streaming_seconds": streaming,
+            "total_seconds": end - self.started_at,
+            "tokens": self.chunk_count,
+            "chars": self.total_chars,
+            "tokens_per_second": self.chunk_count / streaming if streaming else None,
+            "renders": self.flush_count,
+        }
+
+
+def format_stream_stats(stats):
+    """One-line summary such as 'First token 0.42s · 35.1 tokens/s'."""
+    if stats["time_to_first_token"] is None:
+        return ""
+    summary = f"First token {stats['time_to_first_token']:.2f}s"
+    if stats["tokens_per_second"]:
+        summary += f" · {stats['tokens_per_second']:.1f} tokens/s"
+    return summary
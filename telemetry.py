@@ -0,0 +1,246 @@
+# telemetry.py
+import contextlib
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+TELEMETRY_PATH = os.path.join('context', 'telemetry.jsonl')
+SUMMARY_WINDOW = 500
+TAIL_BLOCK_BYTES = 64 * 1024
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+def current_trace():
+    """The RequestTrace being prepared in this context, or None."""
+    return _current_trace.get()
+
+
+class RequestTrace:
+    """Timings and sizes of one chat request, written as one JSONL record when its stream ends.
+
+    Stages are timed with `with trace.stage(name):`; the same stage may be
+    entered more than once and its durations add up.
+    """
+
+    def __init__(self, log, llm_provider, model, kind, clock=time.perf_counter):
+        self.log = log
+        self.clock = clock
+        self.started_at = clock()
+        self.record = {
+            "id": uuid.uuid4().hex,
+            "timestamp": time.time(),
+            "provider": llm_provider,
+            "model": model,
+            "kind": kind,
+            "stages": {},
+            "prompt_chars": 0,
+            "prompt_tokens": None,
+            "completion_chars": 0,
+            "completion_chunks": 0,
+            "time_to_first_token": None,
+            "streaming_seconds": None,
+            "total_seconds": None,
+            "error": None,
+            "cache_hit": False,
+            "routing": None,
+        }
+        self._first_chunk_at = None
+        self._finished = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            stages = self.record["stages"]
+            stages[name] = stages.get(name, 0.0) + (self.clock() - start)
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Makes this trace visible to current_trace() for the duration of the block."""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def set_prompt(self, messages, prompt_tokens=None):
+        """Records the size of the prompt: a string or a list of messages."""
+        if isinstance(messages, str):
+            self.record["prompt_chars"] = len(messages)
+        else:
+            self.record["prompt_chars"] = sum(len(message.content) for message in messages)
+        self.record["prompt_tokens"] = prompt_tokens
+
+    def wrap_stream(self, stream):
+        """Yields from stream, recording time to first chunk, completion size and errors."""
+        try:
+            for chunk in stream:
+                self._observe(chunk)
+                yield chunk
+        except Exception as e:
+            self.record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.finish()
+
+    async def wrap_async_stream(self, stream):
+        """Async counterpart of wrap_stream for async iterators such as LangChain's astream()."""
+        try:
+            async for chunk in stream:
+                self._observe(chunk)
+                yield chunk
+        except Exception as e:
+            self.record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.finish()
+
+    def _observe(self, chunk):
+        if self._first_chunk_at is None:
+            self._first_chunk_at = self.clock()
+            self.record["time_to_first_token"] = self._first_chunk_at - self.started_at
+        content = getattr(chunk, "content", chunk)
+        if isinstance(content, str):
+            self.record["completion_chars"] += len(content)
+        self.record["completion_chunks"] += 1
+
+    def finish(self, error=None):
+        if self._finished:
+            return
+        self._finished = True
+        end = self.clock()
+        if error is not None:
+            self.record["error"] = str(error)
+        if self._first_chunk_at is not None:
+            self.record["streaming_seconds"] = end - self._first_chunk_at
+        self.record["total_seconds"] = end - self.started_at
+        if self.log is not None:
+            self.log.append(self.record)
+
+
+class TelemetryLog:
+    """Append-only JSONL file of request records."""
+
+    def __init__(self, path=TELEMETRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._summary_cache = None
+
+    def append(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def recent(self, limit=SUMMARY_WINDOW):
+        """Returns up to the last `limit` records, reading blocks back from the end of the file.
+
+        The cost depends on `limit`, not on how long the log has grown.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                position = f.seek(0, os.SEEK_END)
+                blocks = []
+                newlines = 0
+                while position > 0 and newlines <= limit:
+                    step = min(TAIL_BLOCK_BYTES, position)
+                    position -= step
+                    f.seek(position)
+                    block = f.read(step)
+                    blocks.append(block)
+                    newlines += block.count(b"\n")
+        except FileNotFoundError:
+            return []
+        lines = b"".join(reversed(blocks)).split(b"\n")
+        if position > 0:
+            lines = lines[1:]  # starts mid-record
+        records = deque(maxlen=limit)
+        for line in lines:
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+        return list(records)
+
+    def summary(self, limit=SUMMARY_WINDOW):
+        """p50/p95 latencies per (provider, model) over recent records, cached until the file changes."""
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return []
+        cached = self._summary_cache
+        if cached is not None and cached[0] == (mtime_ns, limit):
+            return cached[1]
+        result = summarize(self.recent(limit))
+        self._summary_cache = ((mtime_ns, limit), result)
+        return result
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def _rescued(routing):
+    return bool(routing) and routing.get("provider") is not None and routing["provider"] != routing.get("primary")
+
+
+def summarize(records):
+    """Groups records by provider and model with p50/p95 of total time and time to first token.
+
+    hedged counts requests that started a second provider after the hedge
+    deadline; rescued counts those answered by a provider other than the
+    one selected.
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault((record.get("provider"), record.get("model")), []).append(record)
+    rows = []
+    for (llm_provider, model), group in sorted(groups.items(), key=lambda item: str(item[0])):
+        totals = [r["total_seconds"] for r in group if r.get("total_seconds") is not None]
+        ttfts = [r["time_to_first_token"] for r in group if r.get("time_to_first_token") is not None]
+        rows.append({
+            "provider": llm_provider,
+            "model": model,
+            "requests": len(group),
+            "errors": sum(1 for r in group if r.get("error")),
+            "cache_hits": sum(1 for r in group if r.get("cache_hit")),
+            "hedged": sum(1 for r in group if (r.get("routing") or {}).get("hedged")),
+            "rescued": sum(1 for r in group if _rescued(r.get("routing"))),
+            "total_p50": percentile(totals, 50),
+            "total_p95": percentile(totals, 95),
+            "ttft_p50": percentile(ttfts, 50),
+            "ttft_p95": percentile(ttfts, 95),
+        })
+    return rows
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_telemetry_log(path=TELEMETRY_PATH):
+    """Returns the process-wide log for path."""
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            log = TelemetryLog(path)
+            _logs[path] = log
+        return log
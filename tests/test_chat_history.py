@@ -0,0 +1,21 @@
+# tests/test_chat_history.py
+from chat_history import ChatHistoryManager
+
+
+def update(i):
+    diff = "--- a/app.py\n+++ b/app.py\n" + f"+line {i}\n" * 20
+    return {"role": "user", "content": "Files changed:\n\n" + diff, "kind": "context_update", "paths": ["app.py", "old.py"]}
+
+
+def test_pinned_context_updates_stay_within_the_history_budget():
+    files = {"app.py": "print('current')\n"}
+    manager = ChatHistoryManager("Ollama", 400, file_source=lambda paths: {p: files[p] for p in paths if p in files})
+    history = []
+    for i in range(40):
+        history.append(update(i))
+        history += [{"role": "user", "content": f"question {i} " * 20}, {"role": "assistant", "content": f"answer {i} " * 20}]
+        text = manager.format(history)
+        assert manager.last_stats["history_tokens"] <= 400
+
+    assert "+line" not in manager.pinned_text()
+    assert "print('current')" in text and "old.py" in text
@@ -0,0 +1,66 @@
+# tests/test_client_registry.py
+import asyncio
+
+from client_registry import ClientRegistry, LeasedStream
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def stream(self, prompt):
+        yield from prompt
+
+    async def astream(self, prompt):
+        for chunk in prompt:
+            yield chunk
+
+
+def test_client_streaming_past_the_idle_timeout_is_not_closed():
+    clock = FakeClock()
+    registry = ClientRegistry(idle_timeout=60, clock=clock)
+    client = registry.get("chat", FakeClient, checkout=True)
+    stream = LeasedStream(registry, "chat", client.stream(["a", "b"]))
+
+    assert next(stream) == "a"
+    clock.now += 600
+    registry.get("other", FakeClient)  # runs the idle eviction
+    assert not client.closed and registry.stats()["in_use"] == 1
+
+    assert list(stream) == ["b"]
+    assert registry.stats()["in_use"] == 0
+    clock.now += 30
+    registry.get("other", FakeClient)
+    assert not client.closed  # idle time counts from the end of the stream
+
+    clock.now += 31
+    registry.get("other", FakeClient)
+    assert client.closed and registry.stats()["clients"] == 1
+
+
+def test_checkout_ends_when_a_stream_is_closed_or_dropped():
+    registry = ClientRegistry()
+    client = registry.get("chat", FakeClient, checkout=True)
+    registry.get("chat", FakeClient, checkout=True)
+    registry.get("chat", FakeClient, checkout=True)
+
+    closed = LeasedStream(registry, "chat", client.stream(["a"]))
+    closed.close()
+    LeasedStream(registry, "chat", client.stream(["a"]))  # never iterated, dropped at once
+
+    async def consume():
+        return [chunk async for chunk in LeasedStream(registry, "chat", client.astream(["a", "b"]))]
+
+    assert asyncio.run(consume()) == ["a", "b"]
+    assert registry.stats()["in_use"] == 0
@@ -0,0 +1,21 @@
+# tests/test_context_packer.py
+from context_packer import TokenCounter, pack_context
+from context_writer import iter_context_sections
+
+
+def test_stop_words_and_common_terms_do_not_outrank_a_rare_term():
+    files = {
+        # Full of words from the question that say nothing about the file.
+        "notes.py": "# what does this do and how does it handle the request\n" * 40,
+        "server.py": "def handle(request):\n    return respond(request)\n" * 40,
+        "tokenizer.py": "def split(text):\n    return text.split()\n" * 40,
+    }
+    code_context = "".join(iter_context_sections("", files))
+    one_file = len("".join(iter_context_sections("", {"notes.py": files["notes.py"]}))) // 4 + 10
+
+    _, packed, stats = pack_context("", code_context, "What does the tokenizer do with the request?",
+                                    TokenCounter("Ollama"), one_file + 30)
+
+    assert stats["files_included"] == 1
+    assert "=== File: tokenizer.py ===\n" + files["tokenizer.py"] in packed
+    assert sorted(stats["files_omitted"]) == ["notes.py", "server.py"]
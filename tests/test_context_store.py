@@ -0,0 +1,23 @@
+# tests/test_context_store.py
+import os
+import uuid
+
+from context_store import ContextStore
+
+
+def test_spilled_sessions_are_reloaded_and_swept_after_a_restart(tmp_path):
+    sessions_dir = str(tmp_path)
+    kept, expired = uuid.uuid4().hex, uuid.uuid4().hex
+    store = ContextStore(max_megabytes=0, sessions_dir=sessions_dir)
+    store.put(kept, "code", "print('kept')")
+    store.put(expired, "code", "print('expired')")
+    store.put(uuid.uuid4().hex, "goal", "spills the others")
+    os.utime(store.session_dir(expired), (0, 0))
+
+    restarted = ContextStore(idle_seconds=3600, sessions_dir=sessions_dir)
+    assert restarted.get(kept, "code") == "print('kept')"
+
+    restarted.sweep()
+    assert not os.path.exists(restarted.session_dir(expired))
+    assert restarted.get(expired, "code") is None
+    assert restarted.get(kept, "code") == "print('kept')"
@@ -0,0 +1,140 @@
+# tests/test_ollama_models.py
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ollama_models import OllamaModelCatalog, fetch_models
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubOllama:
+    """An /api/tags endpoint on an ephemeral port; models and delay can change between requests."""
+
+    def __init__(self):
+        self.models = ["llama3:8b"]
+        self.delay = 0
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+                body = json.dumps({"models": [{"name": name, "size": 4_700_000_000} for name in stub.models]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubOllama()
+    yield server
+    server.close()
+
+
+def names(view):
+    return [model["name"] for model in view["models"]]
+
+
+def wait_for_refresh(catalog, base_url, timeout=5):
+    deadline = time.monotonic() + timeout
+    while catalog.get(base_url)["refreshing"]:
+        assert time.monotonic() < deadline, "background refresh did not finish"
+        time.sleep(0.01)
+    return catalog.get(base_url)
+
+
+def closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+def test_fresh_list_is_served_without_refetching(stub):
+    clock = FakeClock()
+    catalog = OllamaModelCatalog(ttl=60, clock=clock)
+
+    first = catalog.get(stub.url)
+    clock.now += 30
+    second = catalog.get(stub.url)
+
+    assert names(first) == names(second) == ["llama3:8b"]
+    assert first["models"][0]["size_bytes"] == 4_700_000_000
+    assert second["age"] == 30 and not second["refreshing"]
+    assert stub.requests == 1
+
+
+def test_stale_list_is_returned_while_refreshing_in_background(stub):
+    clock = FakeClock()
+    catalog = OllamaModelCatalog(ttl=60, clock=clock)
+    catalog.get(stub.url)
+    stub.models = ["llama3:8b", "qwen2:7b"]
+    stub.delay = 0.2
+    clock.now += 61
+
+    stale = catalog.get(stub.url)
+    assert names(stale) == ["llama3:8b"] and stale["refreshing"]
+
+    fresh = wait_for_refresh(catalog, stub.url)
+    assert names(fresh) == ["llama3:8b", "qwen2:7b"]
+    assert fresh["age"] == 0 and fresh["error"] is None
+
+
+def test_slow_host_is_bounded_by_the_read_timeout(stub):
+    stub.delay = 2
+    catalog = OllamaModelCatalog(fetch=lambda url: fetch_models(url, timeout=(1, 0.2)))
+
+    started = time.monotonic()
+    view = catalog.get(stub.url)
+
+    assert time.monotonic() - started < 1.5
+    assert view["models"] == [] and view["error"] and view["age"] is None
+
+
+def test_down_host_reports_an_error():
+    catalog = OllamaModelCatalog(fetch=lambda url: fetch_models(url, timeout=(1, 1)))
+
+    view = catalog.get(closed_port_url())
+
+    assert view["models"] == [] and view["error"] and view["age"] is None
+
+
+def test_failed_refresh_keeps_the_list_and_its_age(stub):
+    clock = FakeClock()
+    catalog = OllamaModelCatalog(ttl=60, clock=clock, fetch=lambda url: fetch_models(url, timeout=(1, 1)))
+    catalog.get(stub.url)
+    stub.close()
+    clock.now += 170
+
+    assert catalog.get(stub.url)["refreshing"]
+    view = wait_for_refresh(catalog, stub.url)
+
+    assert names(view) == ["llama3:8b"] and view["error"]
+    assert view["age"] == 170
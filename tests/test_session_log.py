@@ -0,0 +1,42 @@
+# tests/test_session_log.py
+import uuid
+
+from session_log import SessionLog, get_session_log
+
+
+def test_round_trips_unicode_line_separators(tmp_path):
+    session_id = uuid.uuid4().hex
+    messages = [
+        {"role": "user", "content": "next line\x85separator"},
+        {"role": "assistant", "content": "line\u2028and paragraph\u2029separators"},
+        {"role": "user", "content": "plain\nnewline"},
+    ]
+    log = SessionLog(session_id, str(tmp_path))
+    for message in messages:
+        log.append(message)
+
+    assert log.read() == messages
+    assert log.tail(1) == messages[-1:]
+
+    reopened = SessionLog(session_id, str(tmp_path))
+    assert len(reopened) == 3
+    assert reopened.read(1, 2) == messages[1:2]
+
+
+def test_writers_sharing_a_log_keep_the_index_consistent(tmp_path):
+    session_id = uuid.uuid4().hex
+    first = SessionLog(session_id, str(tmp_path))
+    second = SessionLog(session_id, str(tmp_path))
+    first.append({"role": "user", "content": "one"})
+    second.append({"role": "assistant", "content": "two"})
+    first.append({"role": "user", "content": "three"})
+
+    expected = ["one", "two", "three"]
+    assert [m["content"] for m in first.read()] == expected
+    assert [m["content"] for m in second.read()] == expected
+    assert len(SessionLog(session_id, str(tmp_path))) == 3
+
+
+def test_get_session_log_shares_one_instance_per_session(tmp_path):
+    session_id = uuid.uuid4().hex
+    assert get_session_log(session_id, str(tmp_path)) is get_session_log(session_id, str(tmp_path))
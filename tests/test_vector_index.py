@@ -0,0 +1,70 @@
+# tests/test_vector_index.py
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+from vector_index import FakeEmbeddings, VectorIndex, chunk_file, load_shared_index
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    """FakeEmbeddings that records every text sent to embed_documents."""
+
+    def __init__(self):
+        super().__init__()
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def block(name, word):
+    """A top-level function of 14 lines, long enough to be a chunk of its own."""
+    body = [f"    {word}_{i} = {word}(\"{word}\", {i})" for i in range(12)]
+    return "\n".join([f"def {name}():", *body, f"    return {word}_0"])
+
+
+FILES = {
+    "billing.py": block("charge", "invoice"),
+    "parser.py": block("parse", "token"),
+    "render.py": block("draw", "pixel"),
+}
+
+
+def test_saved_index_loads_and_ranks_the_matching_chunk_first(tmp_path):
+    embeddings = FakeEmbeddings()
+    index = VectorIndex.build(FILES, embeddings, "fake")
+    index.save(str(tmp_path))
+
+    loaded = load_shared_index(str(tmp_path))
+    assert loaded.model_id == "fake" and loaded.chunks == index.chunks
+    assert np.allclose(loaded.vectors, index.vectors)
+    assert load_shared_index(str(tmp_path)) is loaded
+
+    results = loaded.query(embeddings, "where is the token parsed", top_k=2)
+    assert results[0][1]["path"] == "parser.py"
+    assert len(results) == 2 and results[0][0] >= results[1][0]
+    assert len(loaded.query(embeddings, "pixel", top_k=10)) == len(FILES)
+
+
+def test_rebuild_only_embeds_changed_chunks(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    module = "\n\n".join(block(f"step_{i}", f"stage{i}") for i in range(4))
+    assert len(chunk_file("pipeline.py", module)) == 4
+
+    first = CountingEmbeddings()
+    index = VectorIndex.build({"pipeline.py": module}, first, "fake", cache=cache)
+    assert len(first.embedded) == 4
+    assert index.build_stats["cache_misses"] == 4 and index.build_stats["hit_rate"] == 0.0
+
+    edited = module.replace("stage2(\"stage2\", 5)", "stage2(\"changed\", 5)")
+    second = CountingEmbeddings()
+    rebuilt = VectorIndex.build({"pipeline.py": edited}, second, "fake", cache=cache)
+
+    assert len(second.embedded) == 1 and "changed" in second.embedded[0]
+    assert rebuilt.build_stats["cache_hits"] == 3 and rebuilt.build_stats["cache_misses"] == 1
+    unchanged = [i for i in range(4) if i != 2]
+    assert np.allclose(rebuilt.vectors[unchanged], index.vectors[unchanged])
+
+    third = CountingEmbeddings()
+    VectorIndex.build({"pipeline.py": edited}, third, "other-model", cache=cache)
+    assert len(third.embedded) == 4  # cache entries are per embedding model
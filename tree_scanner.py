@@ -0,0 +1,179 @@
+# tree_scanner.py
+import os
+import threading
+
+
+class _DirCacheEntry:
+    """Cached listing and built tree nodes for a single directory."""
+    __slots__ = ("mtime_ns", "raw", "ignore_files", "signature", "entries", "pruned", "nodes")
+
+    def __init__(self, mtime_ns, raw, ignore_files):
+        self.mtime_ns = mtime_ns
+        self.raw = raw  # [(name, is_dir)] in scandir order, unfiltered
+        self.ignore_files = ignore_files
+        self.signature = None  # ignore rules the entries below were filtered with
+        self.entries = None
+        self.pruned = 0
+        self.nodes = None
+
+
+class TreeScanner:
+    """Builds streamlit-tree-select nodes with os.scandir, caching each directory by its mtime.
+
+    A directory is only re-listed when its own mtime changes (an entry was added,
+    removed or renamed), and only re-filtered when an ignore file above it
+    changes. Ignored directories are pruned before they are descended into.
+    Subtrees whose directories are all unchanged reuse the node lists built on
+    the previous scan, so a rerun on an unchanged project costs one stat per
+    directory instead of a listdir + isdir per entry.
+    """
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pruned = 0
+        self.last_scan = {"hits": 0, "misses": 0, "pruned": 0, "errors": []}
+
+    def scan(self, folder_path, stats=None):
+        """Returns the tree for folder_path in the format consumed by tree_select.
+
+        If a dict is passed as stats it is filled with this scan's counters.
+        """
+        if stats is None:
+            stats = {}
+        stats.update({"hits": 0, "misses": 0, "pruned": 0, "errors": []})
+        with self._lock:
+            children, _ = self._scan_dir(folder_path, None, self.matcher.base_context(), stats)
+            self.hits += stats["hits"]
+            self.misses += stats["misses"]
+            self.pruned += stats["pruned"]
+            self.last_scan = stats
+        base_name = os.path.basename(folder_path)
+        return [{"label": base_name, "value": folder_path, "children": children}]
+
+    def stats(self):
+        """Returns cumulative and last-scan hit/miss/pruned counters."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "pruned": self.pruned,
+                "cached_dirs": len(self._cache),
+                "last_scan": dict(self.last_scan),
+            }
+
+    def clear(self):
+        """Drops every cached directory."""
+        with self._lock:
+            self._cache.clear()
+
+    def _list_dir(self, path, mtime_ns, stats):
+        raw = []
+        ignore_files = set()
+        try:
+            with os.scandir(path) as it:
+                for item in it:
+                    try:
+                        is_dir = item.is_dir()
+                    except OSError:
+                        is_dir = False
+                    raw.append((item.name, is_dir))
+                    if not is_dir and item.name in self.matcher.ignore_filenames:
+                        ignore_files.add(item.name)
+        except PermissionError:
+            stats["errors"].append(path)
+            return None
+        except OSError:
+            return None
+        return _DirCacheEntry(mtime_ns, raw, ignore_files)
+
+    def _forget(self, path):
+        """Removes path and everything cached below it."""
+        prefix = path.rstrip(os.sep) + os.sep
+        for key in [k for k in self._cache if k == path or k.startswith(prefix)]:
+            del self._cache[key]
+
+    def _scan_dir(self, path, name, parent_ctx, stats):
+        """Returns (nodes, changed) for the directory at path."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            self._forget(path)
+            return [], True
+
+        entry = self._cache.get(path)
+        changed = False
+        if entry is not None and entry.mtime_ns == mtime_ns:
+            stats["hits"] += 1
+        else:
+            stats["misses"] += 1
+            new_entry = self._list_dir(path, mtime_ns, stats)
+            if new_entry is None:
+                self._forget(path)
+                return [], True
+            if entry is not None:
+                current = {n for n, is_dir in new_entry.raw if is_dir}
+                for n, is_dir in entry.raw:
+                    if is_dir and n not in current:
+                        self._forget(os.path.join(path, n))
+            entry = new_entry
+            self._cache[path] = entry
+            changed = True
+
+        ctx = self.matcher.child_context(parent_ctx, name, path, entry.ignore_files)
+        if entry.signature != ctx.signature or entry.entries is None:
+            entries = []
+            for n, is_dir in entry.raw:
+                if ctx.ignored(n, is_dir):
+                    if is_dir:
+                        self._forget(os.path.join(path, n))
+                    continue
+                entries.append((n, is_dir))
+            entry.entries = entries
+            entry.pruned = len(entry.raw) - len(entries)
+            entry.signature = ctx.signature
+            changed = True
+        stats["pruned"] += entry.pruned
+
+        subtrees = {}
+        for n, is_dir in entry.entries:
+            if is_dir:
+                children, child_changed = self._scan_dir(os.path.join(path, n), n, ctx, stats)
+                subtrees[n] = children
+                changed = changed or child_changed
+
+        if not changed and entry.nodes is not None:
+            return entry.nodes, False
+
+        nodes = []
+        for n, is_dir in entry.entries:
+            item_path = os.path.join(path, n)
+            if is_dir:
+                children = subtrees[n]
+                if children:
+                    nodes.append({
+                        "label": n,
+                        "value": item_path,
+                        "children": children,
+                    })
+            else:
+                nodes.append({"label": n, "value": item_path})
+        entry.nodes = nodes
+        return nodes, True
+
+
+_shared_scanners = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_scanner(matcher):
+    """Returns a process-wide scanner for the given ignore matcher, shared by all sessions."""
+    with _shared_lock:
+        scanner = _shared_scanners.get(matcher)
+        if scanner is None:
+            scanner = TreeScanner(matcher)
+            _shared_scanners[matcher] = scanner
+        return scanner
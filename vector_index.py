@@ -0,0 +1,243 @@
+# vector_index.py
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+
+import numpy as np
+
+from context_store import on_session_removed
+
+INDEX_DIR = os.path.join('context', 'vector_index')
+MANIFEST_NAME = 'manifest.json'
+MIN_CHUNK_LINES = 12
+MAX_CHUNK_LINES = 60
+MAX_CHUNK_CHARS = 4000
+EMBED_BATCH_SIZE = 64
+# Inputs per embedding request; Azure deployments commonly reject more than 16.
+EMBED_BATCH_SIZES = {"OpenAI": 512, "Azure OpenAI": 16, "Ollama": 32}
+MAX_BATCH_CHARS = 400000
+DEFAULT_TOP_K = 8
+
+
+def _is_boundary(line, previous):
+    """A top-level line after a blank line, e.g. the start of a def/class/block."""
+    return bool(line) and not line[0].isspace() and not previous.strip()
+
+
+def chunk_file(path, content, min_lines=MIN_CHUNK_LINES, max_lines=MAX_CHUNK_LINES):
+    """Splits a file into chunks of lines, cutting at top-level blocks where possible.
+
+    Boundaries depend on the content rather than on fixed offsets, so an edit
+    only changes the chunks around it and the rest keep hitting the embedding cache.
+    """
+    lines = content.splitlines()
+    chunks = []
+    start = 0
+    for i in range(1, len(lines) + 1):
+        size = i - start
+        at_end = i == len(lines)
+        if not at_end and size < max_lines and not (size >= min_lines and _is_boundary(lines[i], lines[i - 1])):
+            continue
+        text = "\n".join(lines[start:i])[:MAX_CHUNK_CHARS]
+        if text.strip():
+            chunks.append({"path": path, "start": start + 1, "end": i, "text": text})
+        start = i
+    return chunks
+
+
+def chunk_files(file_contents):
+    """Chunks every file of a {rel_path: content} mapping."""
+    chunks = []
+    for path, content in file_contents.items():
+        chunks.extend(chunk_file(path, content))
+    return chunks
+
+
+def chunk_embedding_text(chunk):
+    """Text sent to the embedding model; the path header helps path-oriented questions.
+
+    Line numbers are left out so a chunk that merely moved keeps its cache key.
+    """
+    return f"File: {chunk['path']}\n{chunk['text']}"
+
+
+def iter_batches(texts, batch_size=EMBED_BATCH_SIZE, max_batch_chars=MAX_BATCH_CHARS):
+    """Yields (start, batch) slices of texts bounded by count and total characters."""
+    start = 0
+    while start < len(texts):
+        end = start
+        chars = 0
+        while end < len(texts) and end - start < batch_size:
+            if end > start and chars + len(texts[end]) > max_batch_chars:
+                break
+            chars += len(texts[end])
+            end += 1
+        yield start, texts[start:end]
+        start = end
+
+
+def embed_in_batches(embeddings, texts, batch_size=EMBED_BATCH_SIZE, max_batch_chars=MAX_BATCH_CHARS):
+    """Embeds texts with a LangChain embeddings object; returns (matrix, number of requests)."""
+    vectors = []
+    calls = 0
+    for _, batch in iter_batches(texts, batch_size, max_batch_chars):
+        vectors.extend(embeddings.embed_documents(batch))
+        calls += 1
+    return np.asarray(vectors, dtype=np.float32), calls
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorIndex:
+    """Unit-normalized chunk embeddings searched by cosine similarity.
+
+    On disk the index is a manifest pointing at a .npy matrix and a JSON list of
+    chunks. The manifest is replaced last, so readers never see a half-written
+    index, and the matrix is memory-mapped on load.
+    """
+
+    def __init__(self, vectors, chunks, model_id):
+        self.vectors = vectors
+        self.chunks = chunks
+        self.model_id = model_id
+        self.build_stats = None
+
+    @classmethod
+    def build(cls, file_contents, embeddings, model_id, batch_size=EMBED_BATCH_SIZE, cache=None):
+        """Chunks and embeds file_contents; with an EmbeddingCache only unseen chunks are embedded."""
+        chunks = chunk_files(file_contents)
+        texts = [chunk_embedding_text(c) for c in chunks]
+        if not chunks:
+            index = cls(np.zeros((0, 0), dtype=np.float32), [], model_id)
+            index.build_stats = {"chunks": 0, "cache_hits": 0, "cache_misses": 0, "hit_rate": 0.0,
+                                 "embedding_calls": 0, "embedding_calls_saved": 0}
+            return index
+        if cache is not None:
+            vectors, build_stats = cache.embed(embeddings, model_id, texts, batch_size)
+        else:
+            vectors, calls = embed_in_batches(embeddings, texts, batch_size)
+            build_stats = {"chunks": len(texts), "cache_hits": 0, "cache_misses": len(texts), "hit_rate": 0.0,
+                           "embedding_calls": calls, "embedding_calls_saved": 0}
+        index = cls(_normalize(vectors), chunks, model_id)
+        index.build_stats = build_stats
+        return index
+
+    def save(self, index_dir=INDEX_DIR):
+        os.makedirs(index_dir, exist_ok=True)
+        token = uuid.uuid4().hex[:12]
+        vectors_name = f"vectors-{token}.npy"
+        chunks_name = f"chunks-{token}.json"
+        np.save(os.path.join(index_dir, vectors_name), np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(os.path.join(index_dir, chunks_name), 'w', encoding='utf-8') as f:
+            json.dump(self.chunks, f)
+        manifest = {
+            "model_id": self.model_id,
+            "vectors": vectors_name,
+            "chunks": chunks_name,
+            "count": len(self.chunks),
+        }
+        tmp_manifest = os.path.join(index_dir, f".{MANIFEST_NAME}.{token}.tmp")
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_manifest, os.path.join(index_dir, MANIFEST_NAME))
+        for name in os.listdir(index_dir):
+            if name.startswith(("vectors-", "chunks-")) and name not in (vectors_name, chunks_name):
+                try:
+                    os.unlink(os.path.join(index_dir, name))
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR):
+        with open(os.path.join(index_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        vectors = np.load(os.path.join(index_dir, manifest["vectors"]), mmap_mode='r')
+        with open(os.path.join(index_dir, manifest["chunks"]), 'r', encoding='utf-8') as f:
+            chunks = json.load(f)
+        return cls(vectors, chunks, manifest["model_id"])
+
+    def search(self, query_vector, top_k=DEFAULT_TOP_K):
+        """Returns [(score, chunk)] for the top_k chunks most similar to query_vector."""
+        if not self.chunks:
+            return []
+        query = _normalize(np.asarray(query_vector, dtype=np.float32))
+        scores = self.vectors @ query
+        top_k = min(top_k, len(self.chunks))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.chunks[i]) for i in top]
+
+    def query(self, embeddings, text, top_k=DEFAULT_TOP_K):
+        return self.search(embeddings.embed_query(text), top_k)
+
+
+def format_retrieved_chunks(results):
+    """Formats search results like the file blocks of code.txt, one block per chunk."""
+    blocks = []
+    for _, chunk in results:
+        header = f"=== File: {chunk['path']} (lines {chunk['start']}-{chunk['end']}) ==="
+        blocks.append(f"\n{header}\n{chunk['text']}\n{'=' * len(header)}\n")
+    return "".join(blocks)
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_shared_index(index_dir=INDEX_DIR):
+    """Returns the index at index_dir, reloading only when its manifest changed; None if missing."""
+    manifest_path = os.path.join(index_dir, MANIFEST_NAME)
+    try:
+        mtime_ns = os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        return None
+    key = os.path.abspath(index_dir)
+    with _loaded_lock:
+        cached = _loaded.get(key)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        index = VectorIndex.load(index_dir)
+        _loaded[key] = (mtime_ns, index)
+        return index
+
+
+def forget(directory):
+    """Drops loaded indexes at or under directory, e.g. when a session's directory is deleted."""
+    prefix = os.path.abspath(directory)
+    with _loaded_lock:
+        for key in [key for key in _loaded if key == prefix or key.startswith(prefix + os.sep)]:
+            del _loaded[key]
+
+
+on_session_removed(forget)
+
+
+class FakeEmbeddings:
+    """Deterministic offline embeddings: a hashed bag of words, for tests and benchmarks."""
+
+    _TOKEN = re.compile(r"[A-Za-z0-9_]+")
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for token in self._TOKEN.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], 'little') % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)